@@ -3,17 +3,33 @@ import io
 import uuid
 import zipfile
 import time
+import gc
+import math
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from collections import defaultdict
+from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import fitz  # PyMuPDF
 import pdfplumber
 from docx import Document
-from docx.shared import Inches
+from docx.shared import Inches, Pt, RGBColor
 from PIL import Image
 from io import BytesIO
 import hashlib
 import json
+import logging
+from config import Config
+from result_cache import ResultCache
+from raster_cache import RasterCache, page_digest, TIERS
+from jobs import JobStore, JobQueue, OutputReaper
+from instrumentation import PipelineMetrics, configure_logging
+from edition_diff import fingerprint_regions, diff_regions
+from span_rules import SpanClassifier, load_span_rules
+from image_encoding import RegionEncoder, raw_size
+from page_selection import select_pages
 
 # Try to import psutil for detailed health checks, but make it optional
 try:
@@ -22,11 +38,31 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
+configure_logging(Config.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['OUTPUT_FOLDER'] = 'output'
+app.config['UPLOAD_FOLDER'] = Config.UPLOAD_FOLDER
+app.config['OUTPUT_FOLDER'] = Config.OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+app.config['EXTRACTION_WORKERS'] = Config.EXTRACTION_WORKERS
+app.config['PDF_OUTPUT_MODE'] = Config.PDF_OUTPUT_MODE
+app.config['DOCX_OUTPUT_MODE'] = Config.DOCX_OUTPUT_MODE
+app.config['EXTRACTION_WINDOW_PAGES'] = Config.EXTRACTION_WINDOW_PAGES
+app.config['EXTRACTION_MAX_RSS_MB'] = Config.EXTRACTION_MAX_RSS_MB
+app.config['RESULT_CACHE_FOLDER'] = Config.RESULT_CACHE_FOLDER
+app.config['JOB_DB_PATH'] = Config.JOB_DB_PATH
+app.config['METRICS_DB_PATH'] = Config.METRICS_DB_PATH
+app.config['MAX_CONCURRENT_JOBS'] = Config.MAX_CONCURRENT_JOBS
+app.config['PROCESSING_TIMEOUT'] = Config.PROCESSING_TIMEOUT
+app.config['QUEUE_TIMEOUT'] = Config.QUEUE_TIMEOUT
+app.config['MAX_EVENT_STREAMS'] = Config.MAX_EVENT_STREAMS
+app.config['ADMISSION_BUDGET'] = Config.ADMISSION_BUDGET
+app.config['ADMISSION_COST_PER_MB'] = Config.ADMISSION_COST_PER_MB
+app.config['ADMISSION_COST_PER_SECOND'] = Config.ADMISSION_COST_PER_SECOND
+app.config['CLEANUP_INTERVAL'] = Config.CLEANUP_INTERVAL
+app.config['MAX_FILE_AGE'] = Config.MAX_FILE_AGE
 
 # Track app start time for uptime monitoring
 APP_START_TIME = time.time()
@@ -35,146 +71,913 @@ APP_START_TIME = time.time()
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
+# Stage timings and pipeline counters shared by all workers for /metrics
+pipeline_metrics = PipelineMetrics(app.config['METRICS_DB_PATH'])
+
+# Cache of generated documents keyed on PDF content and extraction settings
+result_cache = ResultCache(app.config['RESULT_CACHE_FOLDER'], Config.RESULT_CACHE_MAX_BYTES) if Config.RESULT_CACHE_ENABLED else None
+
+# Encoded images of rendered regions keyed on page content, clip and DPI; the disk tier is shared by all workers
+raster_cache = None
+if Config.RASTER_CACHE_ENABLED:
+    raster_cache = RasterCache(Config.RASTER_CACHE_MAX_BYTES,
+                               ResultCache(Config.RASTER_CACHE_FOLDER, Config.RASTER_CACHE_DISK_MAX_BYTES, suffix='.png')
+                               if Config.RASTER_CACHE_FOLDER else None)
+
 ALLOWED_EXTENSIONS = {'pdf'}
 
+# /events: how often the job store is checked for new events, how long a
+# stream may be idle before a status refresh, and the client reconnect delay
+EVENT_POLL_INTERVAL = 0.25
+EVENT_HEARTBEAT_INTERVAL = 5
+EVENT_RETRY_MS = 2000
+# Each open stream holds one of the worker's threads for the life of its job
+event_stream_slots = threading.BoundedSemaphore(app.config['MAX_EVENT_STREAMS'])
+
+# Rasterization resolution per extracted block type
+RENDER_DPI = {
+    'text': Config.TEXT_DPI,
+    'heading': Config.HEADING_DPI,
+    'table': Config.TABLE_DPI,
+}
+
+# How blocks are written to the extracted PDF: 'raster' inserts rendered
+# images, 'vector' copies the clipped region of the source page as-is
+OUTPUT_MODES = ('raster', 'vector')
+
+# Red, table, heading and section-number span rules; SPAN_RULES_FILE overrides them
+SPAN_RULES = load_span_rules(Config.SPAN_RULES_FILE)
+span_classifier = SpanClassifier(SPAN_RULES)
+
+# How rendered regions are encoded for the Word document and red-content PDF
+region_encoder = RegionEncoder(Config.IMAGE_ENCODING, Config.IMAGE_PALETTE_COLORS, Config.TABLE_IMAGE_FORMAT,
+                               Config.TABLE_JPEG_QUALITY, Config.IMAGE_ENCODE_THREADS)
+
+# Word output: 'image' inserts every block as a picture, 'text' writes text and
+# heading blocks as runs and Word headings, keeping pictures for tables only
+DOCX_OUTPUT_MODES = ('image', 'text')
+DOCX_TEXT_KINDS = ('text', 'heading')
+
+# Regions closer than this many points are rendered as one image; negative disables merging
+REGION_MERGE_GAP = Config.REGION_MERGE_GAP
+
+# A merged region takes the first of its member kinds in this order
+REGION_KIND_PRECEDENCE = ('table', 'text', 'heading')
+
+# Word layout: PDF points per inch of output
+DOCX_POINTS_PER_INCH = 86
+
+# Bump when the extraction output changes so cached results are invalidated
+EXTRACTION_VERSION = 2
+
+def extraction_settings():
+    """Settings that determine the extraction output, used to key cached results"""
+    return {
+        'version': EXTRACTION_VERSION,
+        'render_dpi': RENDER_DPI,
+        'region_merge_gap': REGION_MERGE_GAP,
+        'image_encoding': region_encoder.settings(),
+        'span_rules': SPAN_RULES,
+        'docx_points_per_inch': DOCX_POINTS_PER_INCH,
+        'docx_output_mode': app.config['DOCX_OUTPUT_MODE'],
+    }
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_red_pdf_contents(pdf_data, original_filename=None):
-    """Extract red content from PDF and return processed PDF data"""
-    doc = fitz.open(stream=pdf_data, filetype="pdf")
+def _regions_near(a, b, gap):
+    return (a.x0 - gap <= b.x1 and b.x0 - gap <= a.x1 and
+            a.y0 - gap <= b.y1 and b.y0 - gap <= a.y1)
+
+def _merged_kind(*kinds):
+    return min(kinds, key=REGION_KIND_PRECEDENCE.index)
+
+def merge_regions(regions, gap):
+    """Union overlapping or near-adjacent (rect, kind) regions of one page
     
-    # Configuration
-    dpi_resol = 380
-    red_blocks_found = 0
-    total_blocks = 0
+    Sweeps the regions top to bottom, keeping only those whose bottom edge is
+    within gap of the sweep line as merge candidates. Regions covered by a
+    table collapse into the table. Returns regions in reading order.
+    """
+    done = []
+    active = []
+    for rect, kind in sorted(regions, key=lambda region: (region[0].y0, region[0].x0)):
+        # Regions ending above the sweep line can't touch anything further down
+        done.extend(region for region in active if region[0].y1 + gap < rect.y0)
+        active = [region for region in active if region[0].y1 + gap >= rect.y0]
+        
+        current = (fitz.Rect(rect), kind)
+        merged = True
+        while merged:
+            merged = False
+            for region in active:
+                if _regions_near(region[0], current[0], gap):
+                    active.remove(region)
+                    current = (current[0] | region[0], _merged_kind(current[1], region[1]))
+                    merged = True
+                    break
+        active.append(current)
+    done.extend(active)
     
-    # Create new PDF for red content
-    new_pdf = fitz.open()
+    # A union that grew sideways may now reach a region retired earlier
+    merged = True
+    while merged:
+        merged = False
+        for i, j in ((i, j) for i in range(len(done)) for j in range(i + 1, len(done))):
+            if _regions_near(done[i][0], done[j][0], gap):
+                done[i] = (done[i][0] | done[j][0], _merged_kind(done[i][1], done[j][1]))
+                del done[j]
+                merged = True
+                break
+    
+    return sorted(done, key=lambda region: (region[0].y0, region[0].x0))
+
+def open_pdf(pdf_source):
+    """Open PDF bytes, or a file path that MuPDF reads from disk on demand"""
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return fitz.open(pdf_source, filetype="pdf")
+    return fitz.open(stream=pdf_source, filetype="pdf")
+
+class TableIndex:
+    """Table bounding boxes of one PDF, detected lazily per page and memoized
     
-    print(f"Processing PDF with {doc.page_count} pages...")
+    pdfplumber is opened once per document instead of once per table span, so
+    table detection costs O(pages) rather than O(pages^2) on large documents.
+    With pages, a list of zero-based page numbers, pdfplumber only loads those.
+    """
     
-    for page_num in range(doc.page_count):
-        page_has_redtable = False
-        tableposted_flag = False
-        new_page = new_pdf.new_page(width=doc[page_num].rect.width, height=doc[page_num].rect.height)
-        page_flag = False
-        text_blocks = doc[page_num].get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
-        page_red_blocks = 0
-        
-        print(f"Page {page_num + 1}: Found {len(text_blocks)} text blocks")
+    def __init__(self, pdf_source, pages=None):
+        self.pdf_source = pdf_source
+        self.pages = pages
+        self._pdf = None
+        self._pages = None
+        self._bboxes = {}
+    
+    def bboxes(self, page_num):
+        """Bounding boxes of the tables on a zero-based page number"""
+        if page_num not in self._bboxes:
+            if self._pdf is None:
+                source = self.pdf_source
+                if not isinstance(source, (str, os.PathLike)):
+                    source = BytesIO(source)
+                self._pdf = pdfplumber.open(source, pages=None if self.pages is None
+                                            else [number + 1 for number in self.pages])
+                self._pages = {page.page_number - 1: page for page in self._pdf.pages}
+            page = self._pages[page_num]
+            self._bboxes[page_num] = [table.bbox for table in page.find_tables()]
+            # Drop the parsed layout objects, only the bboxes are needed
+            page.flush_cache()
+        return self._bboxes[page_num]
+    
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+            self._pages = None
+
+def _raster_key(digest, rect, kind):
+    return RasterCache.make_key(digest, rect, RENDER_DPI[kind],
+                                json.dumps(region_encoder.settings(), sort_keys=True))
+
+def _cached_region(digest, rect, kind, cache_counts):
+    """Encoded image of a region from the raster cache, or None on a miss
+    
+    digest is the page_digest, None to bypass the cache. Lookups are counted
+    in cache_counts.
+    """
+    if raster_cache is None or digest is None:
+        return None
+    data, tier = raster_cache.get(_raster_key(digest, rect, kind))
+    if data is None:
+        cache_counts['misses'] += 1
+        return None
+    cache_counts[f'{tier}_hits'] += 1
+    return data
+
+def _encode_placements(placements, digest, new_rasters):
+    """Replace the rendered pixmaps in placements with encoded images and cache them
+    
+    The regions are encoded together by region_encoder, on its thread pool in
+    compact mode. Cached regions are appended to new_rasters as (key, data).
+    Returns (uncompressed bytes encoded, encoded bytes).
+    """
+    pending = [index for index, (_, _, pix) in enumerate(placements) if isinstance(pix, fitz.Pixmap)]
+    if not pending:
+        return 0, 0
+    raw_bytes = sum(placements[index][2].size for index in pending)
+    encoded = region_encoder.encode_all([(placements[index][2], placements[index][1]) for index in pending])
+    for index, data in zip(pending, encoded):
+        rect, kind, _ = placements[index]
+        placements[index] = (rect, kind, data)
+        if raster_cache is not None and digest is not None:
+            key = _raster_key(digest, rect, kind)
+            raster_cache.put(key, data)
+            new_rasters.append((key, data))
+    return raw_bytes, sum(map(len, encoded))
+
+def _new_cache_counts():
+    return dict.fromkeys([f'{tier}_hits' for tier in TIERS] + ['misses'], 0)
+
+def _extract_red_page(doc, page_num, table_index, total_blocks=0, render=True, text_kinds=(), encode_images=False):
+    """Find red content on one page and return its placements in insertion order
+    
+    Each placement is (rect, kind, pixmap) with kind 'text', 'heading' or 'table'.
+    With render=False the regions are only located and pixmap is None. With
+    encode_images the pixmap is replaced by its image bytes from region_encoder,
+    served from the raster cache when the same region of an identical page was
+    rendered before.
+    Placements of a kind in text_kinds are captured as text instead: their
+    region_blocks entry lists the (bbox, heading_level, lines) of each text
+    block, a line being (bottom, runs) with (text, size, bold, italic, color)
+    runs, and they are only rendered when no text could be captured.
+    region_spans holds the (text, font, size) content spans of each
+    placement, red spans or all spans of a table, and headings the (bbox,
+    number) of the page's numbered section headings; both fingerprint
+    edition changes.
+    """
+    classify_start = time.perf_counter()
+    table_seconds = 0.0
+    # Per-span logging is costly on dense pages, so only format it when enabled
+    debug = logger.isEnabledFor(logging.DEBUG)
+    
+    page = doc[page_num]
+    page_has_redtable = False
+    tableposted_flag = False
+    regions = []
+    content_spans = []
+    headings = []
+    text_blocks_found = []
+    page_flag = False
+    text_blocks = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+    page_red_blocks = 0
+    red_blocks_found = 0
+    block_count = 0
+    
+    if debug:
+        logger.debug("Page text blocks", extra={'page': page_num + 1, 'text_blocks': len(text_blocks)})
+    
+    # Extract red content
+    for i, block in enumerate(text_blocks):
+        if 'lines' not in block:
+            continue
+            
+        block_count += 1
+        x0, y0, x1, y1 = block['bbox']
+        rect = fitz.Rect(x0, y0, x1, y1)
+        block_flag = False
+        block_printed = False
+        block_text = ""
+        section_number = None
+        block_lines = []
         
-        # Extract red content
-        for i, block in enumerate(text_blocks):
-            if 'lines' not in block:
-                continue
+        for line in block["lines"]:
+            line_runs = []
+            for span in line["spans"]:
+                if text_kinds and span["text"]:
+                    line_runs.append((span["text"], round(span["size"], 1),
+                                      bool(span["flags"] & fitz.TEXT_FONT_BOLD) or span_classifier.is_bold(span["font"]),
+                                      bool(span["flags"] & fitz.TEXT_FONT_ITALIC), span["color"]))
+                text = span["text"].strip()
+                if not text:
+                    continue
+                    
+                is_first_span = not block_text
+                block_text += text + " "
+                font_size = span.get("size", None)
+                font_name = span.get("font", "")
+                color_class = span_classifier.color_class(span["color"])
+                is_bold = span_classifier.is_bold(font_name)
+                if is_first_span and is_bold and span_classifier.is_section_number(text):
+                    section_number = text
                 
-            total_blocks += 1
-            x0, y0, x1, y1 = block['bbox']
-            rect = fitz.Rect(x0, y0, x1, y1)
-            block_flag = False
-            block_printed = False
-            block_text = ""
-            
-            for line in block["lines"]:
-                for span in line["spans"]:
-                    text = span["text"].strip()
-                    if not text:
-                        continue
+                # Debug: Log color information for first few blocks
+                if debug and total_blocks + block_count <= 5:
+                    logger.debug("Span sample", extra={'block': total_blocks + block_count, 'text': text[:20],
+                                                       'color': fitz.sRGB_to_rgb(span["color"]),
+                                                       'font': font_name, 'size': font_size})
+                
+                is_red = color_class == 'red'
+                is_excluded = is_red and span_classifier.is_excluded(text)
+                span_x0, span_y0, span_x1, span_y1 = span["bbox"]
+                content_spans.append(((span_x0 + span_x1) / 2, (span_y0 + span_y1) / 2, text, font_name,
+                                      round(font_size or 0, 1), is_red and not is_excluded))
+                
+                if is_red:
+                    if debug:
+                        logger.debug("Red span", extra={'page': page_num + 1, 'text': text,
+                                                        'color': fitz.sRGB_to_rgb(span["color"])})
+                    if not is_excluded:
+                        if not page_flag:
+                            page_flag = True
+                        block_flag = True
+                        page_red_blocks += 1
                         
-                    block_text += text + " "
-                    font_size = span.get("size", None)
-                    font_name = span.get("font", "")
-                    color = fitz.sRGB_to_rgb(span["color"])
-                    is_bold = "Bold" in font_name or "Black" in font_name
-                    
-                    # Debug: Print color information for first few blocks
-                    if total_blocks <= 5:
-                        print(f"  Block {total_blocks}: Text='{text[:20]}...', Color={color}, Font={font_name}, Size={font_size}")
-                    
-                    # Check for red color text - be more flexible with red detection
-                    # Standard red: (218, 31, 51), but also check for similar reds
-                    red_threshold = 50  # Allow some variation
-                    is_red = (color[0] > 150 and color[1] < 100 and color[2] < 100) or color == (218, 31, 51)
-                    
-                    if is_red:
-                        print(f"Found RED text on page {page_num + 1}: '{text}' with color {color}")
-                        if text not in ["•", "●", "∙", "–"]:
-                            if not page_flag:
-                                print(f"Processing page number: {page_num + 1}")
-                                page_flag = True
-                            block_flag = True
-                            page_red_blocks += 1
+                        # Handle tables with red text
+                        if not tableposted_flag and span_classifier.is_table(font_size, font_name, text):
                             
-                            # Handle tables with red text
-                            if ((font_size == 9 and font_name == "TimesNewRomanPSMT") or 
-                                (font_size == 12 and font_name == "Arial-ItalicMT" and text in ["2024", "2025"])) and not tableposted_flag:
-                                
-                                try:
-                                    with pdfplumber.open(BytesIO(pdf_data)) as pdf_plumber:
-                                        for page_number, page in enumerate(pdf_plumber.pages, start=1):
-                                            if page_number == page_num + 1:
-                                                tables = page.find_tables()
-                                                if tables:
-                                                    page_has_redtable = True
-                                                    print(f"Found {len(tables)} tables on page {page_num + 1}")
-                                                    
-                                                    for table_index, table in enumerate(tables):
-                                                        x0_t, top, x1_t, bottom = table.bbox
-                                                        pix = doc[page_num].get_pixmap(dpi=380, clip=(x0_t, top, x1_t, bottom))
-                                                        new_page.insert_image(fitz.Rect(x0_t, top, x1_t, bottom), pixmap=pix)
-                                                    
-                                                    tableposted_flag = True
-                                except Exception as e:
-                                    print(f"Error processing tables: {e}")
-                    
-                    elif color == (0, 0, 0) and not block_printed:
-                        if is_bold and ((font_size == 14 and font_name == "Arial-Black") or 
-                                       (font_size == 36 and font_name == "Arial-Black")):
+                            table_start = time.perf_counter()
                             try:
-                                image = doc[page_num].get_pixmap(dpi=dpi_resol, clip=fitz.Rect(rect))
-                                new_page.insert_image(fitz.Rect(rect), pixmap=image)
-                                block_printed = True
-                                print(f"Added bold black text block on page {page_num + 1}")
-                            except Exception as e:
-                                print(f"Error adding bold text: {e}")
-            
-            # Add block with red content
-            if block_flag:
-                try:
-                    image = doc[page_num].get_pixmap(dpi=dpi_resol, clip=fitz.Rect(rect))
-                    new_page.insert_image(fitz.Rect(rect), pixmap=image)
-                    red_blocks_found += 1
-                    print(f"Added red text block: '{block_text[:50]}...'")
-                except Exception as e:
-                    print(f"Error adding red block: {e}")
+                                table_bboxes = table_index.bboxes(page_num)
+                                if table_bboxes:
+                                    page_has_redtable = True
+                                    if debug:
+                                        logger.debug("Tables found", extra={'page': page_num + 1,
+                                                                            'tables': len(table_bboxes)})
+                                    
+                                    for x0_t, top, x1_t, bottom in table_bboxes:
+                                        regions.append((fitz.Rect(x0_t, top, x1_t, bottom), 'table'))
+                                    
+                                    tableposted_flag = True
+                            except Exception:
+                                logger.warning("Error processing tables", exc_info=True, extra={'page': page_num + 1})
+                            table_seconds += time.perf_counter() - table_start
+                
+                elif color_class == 'black' and not block_printed:
+                    if is_bold and span_classifier.is_heading(font_size, font_name):
+                        regions.append((fitz.Rect(rect), 'heading'))
+                        block_printed = True
+                        if debug:
+                            logger.debug("Heading block", extra={'page': page_num + 1})
+            if line_runs:
+                block_lines.append((round(line["bbox"][3], 1), line_runs))
+        
+        # Numbered section headings anchor red content when comparing editions
+        if section_number is not None:
+            headings.append((tuple(block['bbox']), section_number))
         
-        print(f"Page {page_num + 1}: Added {page_red_blocks} red blocks")
+        if block_lines and block_text:
+            # Word heading level: depth of the section number, 1 for heading-font blocks
+            heading_level = section_number.count('.') + 1 if section_number is not None else int(block_printed)
+            text_blocks_found.append((tuple(block['bbox']), heading_level, block_lines))
+        
+        # Add block with red content
+        if block_flag:
+            regions.append((fitz.Rect(rect), 'text'))
+            red_blocks_found += 1
+            if debug:
+                logger.debug("Red text block", extra={'page': page_num + 1, 'text': block_text[:50]})
+    
+    if debug:
+        logger.debug("Page classified", extra={'page': page_num + 1, 'red_spans': page_red_blocks,
+                                               'regions': len(regions)})
+    
+    if REGION_MERGE_GAP >= 0 and len(regions) > 1:
+        regions = merge_regions(regions, REGION_MERGE_GAP)
+    
+    classify_seconds = time.perf_counter() - classify_start - table_seconds
+    raster_start = time.perf_counter()
+    raster_bytes = 0
+    render_kinds = tuple(RENDER_DPI) if render is True else tuple(render or ())
+    digest = page_digest(doc, page) if encode_images and raster_cache is not None and regions else None
+    cache_counts = _new_cache_counts()
+    new_rasters = []
+    placements = []
+    region_spans = []
+    region_blocks = []
+    for region_rect, kind in regions:
+        rx0, ry0, rx1, ry1 = region_rect
+        blocks = None
+        if kind in text_kinds:
+            blocks = [text_block for text_block in text_blocks_found
+                      if rx0 <= (text_block[0][0] + text_block[0][2]) / 2 <= rx1 and
+                      ry0 <= (text_block[0][1] + text_block[0][3]) / 2 <= ry1] or None
+        pix = None
+        if kind in render_kinds and blocks is None:
+            try:
+                pix = _cached_region(digest, region_rect, kind, cache_counts) if encode_images else None
+                if pix is None:
+                    pix = page.get_pixmap(dpi=RENDER_DPI[kind], clip=region_rect)
+                    raster_bytes += pix.size
+            except Exception:
+                logger.warning("Error rendering block", exc_info=True, extra={'page': page_num + 1, 'kind': kind})
+                continue
+        placements.append((region_rect, kind, pix))
+        region_blocks.append(blocks)
+        region_spans.append([(text, font_name, font_size)
+                             for center_x, center_y, text, font_name, font_size, is_red in content_spans
+                             if (is_red or kind == 'table') and rx0 <= center_x <= rx1 and ry0 <= center_y <= ry1])
+    image_bytes = _encode_placements(placements, digest, new_rasters) if encode_images else (0, 0)
+    
+    return {
+        'page_num': page_num,
+        'width': page.rect.width,
+        'height': page.rect.height,
+        'placements': placements,
+        'region_spans': region_spans,
+        'region_blocks': region_blocks,
+        'headings': headings,
+        'red_blocks_found': red_blocks_found,
+        'total_blocks': block_count,
+        'raster_bytes': raster_bytes,
+        'image_bytes': image_bytes,
+        'raster_cache': cache_counts,
+        'new_rasters': new_rasters,
+        'timings': {
+            'span_classification': classify_seconds,
+            'table_detection': table_seconds,
+            'rasterization': time.perf_counter() - raster_start
+        }
+    }
+
+# Job processes and extraction workers are forked from a single-threaded fork server, not from this process:
+# forking a gunicorn gthread worker could copy raster_cache's or region_encoder's lock while another thread holds it
+_extract_context = multiprocessing.get_context('forkserver')
+if __name__ != '__main__':
+    # Workers fork with this module already imported instead of importing it each
+    _extract_context.set_forkserver_preload([__name__])
+
+# Per-process state for parallel extraction workers, set by _init_extract_worker
+_worker_doc = None
+_worker_table_index = None
+_worker_render = True
+_worker_text_kinds = ()
+_worker_encode_images = False
+
+def _init_extract_worker(pdf_source, render, text_kinds, encode_images, selected_pages):
+    """Open the source PDF privately in each worker process"""
+    global _worker_doc, _worker_table_index, _worker_render, _worker_text_kinds, _worker_encode_images
+    _worker_doc = open_pdf(pdf_source)
+    _worker_table_index = TableIndex(pdf_source, selected_pages)
+    _worker_render = render
+    _worker_text_kinds = text_kinds
+    _worker_encode_images = encode_images
+
+def _extract_red_page_chunk(page_nums):
+    """Worker entry point: extract a chunk of pages with picklable results"""
+    results = []
+    for page_num in page_nums:
+        result = _extract_red_page(_worker_doc, page_num, _worker_table_index, render=_worker_render,
+                                   text_kinds=_worker_text_kinds, encode_images=_worker_encode_images)
+        # Pixmaps cannot cross process boundaries, ship their raw samples instead (encoded images as they are)
+        result['placements'] = [
+            ((r.x0, r.y0, r.x1, r.y1), kind,
+             (pix.width, pix.height, pix.alpha, pix.xres, pix.yres, pix.samples) if isinstance(pix, fitz.Pixmap)
+             else pix)
+            for r, kind, pix in result['placements']
+        ]
+        results.append(result)
+    return results
+
+def _iter_red_pages_parallel(pdf_source, page_nums, workers, render=True, text_kinds=(), encode_images=False,
+                             selected_pages=None):
+    """Yield per-page results for page_nums in order from a pool of worker processes
     
-    print(f"Total red blocks found and processed: {red_blocks_found} out of {total_blocks} total blocks")
+    selected_pages is the page selection of the whole run, passed on to the
+    workers' TableIndex.
+    """
+    page_count = len(page_nums)
+    chunk_count = min(page_count, workers * 4)
+    bounds = [page_count * i // chunk_count for i in range(chunk_count + 1)]
+    chunks = [page_nums[bounds[i]:bounds[i + 1]] for i in range(chunk_count)]
     
-    # Save to memory buffer
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=_extract_context, initializer=_init_extract_worker,
+                                   initargs=(pdf_source, render, text_kinds, encode_images, selected_pages))
+    try:
+        for results in executor.map(_extract_red_page_chunk, chunks):
+            for result in results:
+                placements = []
+                for rect, kind, pix_data in result['placements']:
+                    pix = pix_data
+                    if isinstance(pix_data, tuple):
+                        width, height, alpha, xres, yres, samples = pix_data
+                        pix = fitz.Pixmap(fitz.csRGB, width, height, samples, alpha)
+                        pix.set_dpi(xres, yres)
+                    placements.append((fitz.Rect(rect), kind, pix))
+                result['placements'] = placements
+                # Keep the regions this worker rendered in the parent's memory tier for later jobs
+                if raster_cache is not None:
+                    for key, data in result['new_rasters']:
+                        raster_cache.put(key, data, disk=False)
+                yield result
+    finally:
+        # Don't render the remaining ranges if the consumer stopped early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _count_raster_cache(cache_counts):
+    for name, count in cache_counts.items():
+        pipeline_metrics.inc(f'app_raster_cache_{name}_total', count)
+
+def _count_image_bytes(raw_bytes, encoded_bytes):
+    pipeline_metrics.inc('app_image_bytes_encoded_total', encoded_bytes)
+    pipeline_metrics.inc('app_image_bytes_saved_total', raw_bytes - encoded_bytes)
+
+def current_rss():
+    """Resident set size of this process in bytes, or None when it can't be read"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def release_memory():
+    """Free unreachable page objects and empty MuPDF's cache of decoded fonts and images"""
+    gc.collect()
+    fitz.TOOLS.store_shrink(100)
+
+def _iter_red_pages(pdf_source, workers=None, progress=None, render=True, text_kinds=(), encode_images=False,
+                    window_pages=None, max_rss_mb=None, pages=None, sections=()):
+    """Yield per-page extraction results in page order
+    
+    pdf_source is the PDF as bytes or a file path; a path is opened in place by
+    MuPDF and pdfplumber (and by each worker process) without loading it whole.
+    With workers > 1 the pages are split into ranges and processed by a pool of
+    worker processes; the merged output is identical to the sequential path.
+    progress, if given, is called as progress(pages_done, page_count,
+    red_blocks) after each page. With render=False blocks are located but not
+    rasterized; render may also be a tuple of the kinds to rasterize.
+    text_kinds are captured as text where possible and encode_images yields
+    rendered blocks as encoded images through the raster cache, see
+    _extract_red_page.
+    
+    pages (a 1-based range spec such as "3-5, 9") and sections (outline entry
+    titles, see page_selection) restrict extraction to the union of the pages
+    they select; the other pages are never loaded, and progress counts the
+    selected pages only. Raises ValueError if the selection doesn't resolve.
+    
+    With window_pages > 0 the document is processed that many pages at a time:
+    between windows the source document, the pdfplumber copy and the worker
+    pool are closed and MuPDF's caches emptied, so memory held by the pipeline
+    doesn't grow with the page count. A window also ends early once the
+    process RSS exceeds max_rss_mb; the next window is shrunk to the pages
+    that fitted and grows back while windows stay under the ceiling. The last
+    page of each window has result['window_end'] set, which is when consumers
+    flush their output.
+    """
+    if workers is None:
+        workers = app.config['EXTRACTION_WORKERS']
+    if window_pages is None:
+        window_pages = app.config['EXTRACTION_WINDOW_PAGES']
+    if max_rss_mb is None:
+        max_rss_mb = app.config['EXTRACTION_MAX_RSS_MB']
+    
+    with pipeline_metrics.time('pdf_open'):
+        doc = open_pdf(pdf_source)
+    try:
+        selected_pages = select_pages(doc, pages, sections)
+    except ValueError:
+        doc.close()
+        raise
+    page_nums = list(range(doc.page_count)) if selected_pages is None else selected_pages
+    page_count = len(page_nums)
+    table_index = TableIndex(pdf_source, selected_pages)
+    if window_pages <= 0:
+        window_pages = page_count
+    max_window_pages = window_pages
+    max_rss = max_rss_mb * 1024 * 1024 if max_rss_mb > 0 else None
+    
+    red_blocks_found = 0
+    total_blocks = 0
+    stage_seconds = dict.fromkeys(('span_classification', 'table_detection', 'rasterization'), 0.0)
+    
+    logger.info("Processing PDF", extra={'pages': page_count, 'document_pages': doc.page_count, 'workers': workers,
+                                         'window_pages': window_pages})
+    
+    try:
+        pages_done = 0
+        while pages_done < page_count:
+            start = pages_done
+            stop = min(start + window_pages, page_count)
+            if workers > 1 and stop - start > 1:
+                page_results = _iter_red_pages_parallel(pdf_source, page_nums[start:stop], workers, render,
+                                                        text_kinds, encode_images, selected_pages)
+            else:
+                page_results = (_extract_red_page(doc, page_num, table_index, total_blocks, render, text_kinds,
+                                                  encode_images)
+                                for page_num in page_nums[start:stop])
+            
+            try:
+                for result in page_results:
+                    pages_done += 1
+                    red_blocks_found += result['red_blocks_found']
+                    total_blocks += result['total_blocks']
+                    for stage, seconds in result['timings'].items():
+                        stage_seconds[stage] += seconds
+                    pipeline_metrics.inc('app_pages_processed_total')
+                    pipeline_metrics.inc('app_red_blocks_found_total', result['red_blocks_found'])
+                    pipeline_metrics.inc('app_raster_bytes_total', result['raster_bytes'])
+                    _count_image_bytes(*result.pop('image_bytes'))
+                    _count_raster_cache(result.pop('raster_cache'))
+                    del result['new_rasters']
+                    
+                    rss = current_rss() if max_rss is not None and pages_done < stop else None
+                    over_ceiling = rss is not None and rss > max_rss
+                    if over_ceiling:
+                        # The next window holds only as many pages as fit this time
+                        window_pages = pages_done - start
+                        logger.warning("RSS ceiling reached, ending page window early",
+                                       extra={'page': result['page_num'], 'rss_mb': rss // (1024 * 1024),
+                                              'max_rss_mb': max_rss_mb, 'window_pages': window_pages})
+                    result['window_end'] = pages_done == stop or over_ceiling
+                    yield result
+                    if progress is not None:
+                        progress(pages_done, page_count, result['red_blocks_found'])
+                    if result['window_end']:
+                        break
+            finally:
+                # Stops the worker pool, dropping any pages rendered past an early window end
+                page_results.close()
+            
+            if pages_done == stop:
+                # A window that stayed under the ceiling lets the next one grow back
+                window_pages = min(window_pages * 2, max_window_pages)
+            if pages_done < page_count:
+                table_index.close()
+                doc.close()
+                release_memory()
+                doc = open_pdf(pdf_source)
+                pipeline_metrics.inc('app_page_windows_total')
+        
+        for stage, seconds in stage_seconds.items():
+            pipeline_metrics.observe(stage, seconds)
+        logger.info("Red content extracted", extra={'pages': page_count, 'red_blocks': red_blocks_found,
+                                                    'total_blocks': total_blocks})
+    finally:
+        table_index.close()
+        doc.close()
+
+def _add_page_to_pdf(new_pdf, result, src_doc=None, vector=False):
+    new_page = new_pdf.new_page(width=result['width'], height=result['height'])
+    for rect, kind, pix in result['placements']:
+        if vector or pix is None:
+            # Vector mode, or a block kept as text: show the clipped source region at the same position
+            new_page.show_pdf_page(rect, src_doc, result['page_num'], clip=rect)
+        elif isinstance(pix, bytes):
+            # An RGB PNG gives the same image object as its pixmap; grayscale and JPEG are kept as they are
+            new_page.insert_image(rect, stream=pix)
+        else:
+            new_page.insert_image(rect, pixmap=pix)
+
+def _save_pdf(new_pdf):
+    # Save to memory buffer (no random /ID so identical input gives identical bytes)
     buffer = BytesIO()
-    new_pdf.save(buffer, garbage=4, deflate=True)
+    with pipeline_metrics.time('save'):
+        new_pdf.save(buffer, garbage=4, deflate=True, no_new_id=True)
     pdf_data_result = buffer.getvalue()
     buffer.close()
-    new_pdf.close()
-    doc.close()
-    
     return pdf_data_result
 
+class RedPdfWriter:
+    """Red-content PDF assembled page by page, in memory or on disk
+    
+    Without a path the document stays in memory and close() returns its bytes.
+    With a path, flush() appends the pages added since the last flush to the
+    file with an incremental save and starts a fresh in-memory document, so
+    only the current page window's images are held at once; close() returns
+    the path. A file flushed once has the same bytes as the in-memory PDF.
+    A PDF can't have zero pages, so if none was added close() writes nothing
+    and returns None.
+    """
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.doc = fitz.open()
+        self.pages_written = 0
+    
+    def add_page(self, result, src_doc=None, vector=False):
+        _add_page_to_pdf(self.doc, result, src_doc, vector)
+    
+    def flush(self):
+        if self.path is None or self.doc.page_count == 0:
+            return
+        with pipeline_metrics.time('save'):
+            if self.pages_written == 0:
+                self.doc.save(self.path, garbage=4, deflate=True, no_new_id=True)
+            else:
+                with fitz.open(self.path) as out:
+                    out.insert_pdf(self.doc)
+                    out.save(self.path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+        self.pages_written += self.doc.page_count
+        self.doc.close()
+        self.doc = fitz.open()
+    
+    def close(self):
+        if self.pages_written + self.doc.page_count == 0:
+            self.doc.close()
+            return None
+        if self.path is None:
+            pdf_data_result = _save_pdf(self.doc)
+            self.doc.close()
+            return pdf_data_result
+        self.flush()
+        self.doc.close()
+        return self.path
+
+def iter_red_pdf_pages(pdf_source, pdf_writer, workers=None, progress=None, output_mode=None, pages=None,
+                       sections=()):
+    """Add the red content of each page to a RedPdfWriter, yielding each page's result as it is added
+    
+    Callers can report or save partial output between pages; the result
+    dicts are those of _extract_red_page. The writer is flushed at the end of
+    each page window. output_mode 'raster' inserts each block as a rendered
+    image, encoded by region_encoder unless IMAGE_ENCODING is 'png'; 'vector'
+    copies the clipped source region without rendering anything. pages and
+    sections select the pages to extract as in _iter_red_pages.
+    """
+    if output_mode is None:
+        output_mode = app.config['PDF_OUTPUT_MODE']
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    vector = output_mode == 'vector'
+    
+    src_doc = open_pdf(pdf_source) if vector else None
+    try:
+        for result in _iter_red_pages(pdf_source, workers, progress, render=not vector,
+                                      encode_images=not vector and region_encoder.encoding != 'png',
+                                      pages=pages, sections=sections):
+            pdf_writer.add_page(result, src_doc)
+            if result['window_end']:
+                pdf_writer.flush()
+            yield result
+    finally:
+        if src_doc is not None:
+            src_doc.close()
+
+def extract_red_pdf_contents(pdf_source, original_filename=None, workers=None, progress=None, output_mode=None,
+                             output_path=None, pages=None, sections=()):
+    """Extract red content from PDF bytes or path and return processed PDF data
+    
+    With output_path the PDF is written there a page window at a time (see
+    RedPdfWriter) and output_path is returned instead of the data. pages and
+    sections limit the output to the selected pages, see _iter_red_pages.
+    """
+    # Create new PDF for red content
+    pdf_writer = RedPdfWriter(output_path)
+    for _ in iter_red_pdf_pages(pdf_source, pdf_writer, workers, progress, output_mode, pages, sections):
+        pass
+    return pdf_writer.close()
+
+def _image_record(page_num, rect, kind, pix, blocks=None):
+    """Positioned record for the Word builder: an image, or text blocks when given
+    
+    pix is a pixmap or its already encoded image bytes.
+    """
+    record = {
+        "page": page_num,
+        "kind": kind,
+        "x0": rect.x0,
+        "y0": rect.y0,
+        "x1": rect.x1,
+        "y1": rect.y1,
+        "width": rect.width,
+        "height": rect.height
+    }
+    if blocks is not None:
+        record["blocks"] = blocks
+    else:
+        record["image_bytes"] = pix if isinstance(pix, bytes) else pix.tobytes("png")
+        record["image_ext"] = "jpeg" if record["image_bytes"].startswith(b'\xff\xd8') else "png"
+    return record
+
+def _docx_text_kinds(docx_mode):
+    if docx_mode is None:
+        docx_mode = app.config['DOCX_OUTPUT_MODE']
+    if docx_mode not in DOCX_OUTPUT_MODES:
+        raise ValueError(f"Unknown DOCX output mode: {docx_mode}")
+    return DOCX_TEXT_KINDS if docx_mode == 'text' else ()
+
+def extract_red_images(pdf_source, original_filename=None, workers=None, include_pdf=False, progress=None,
+                       output_mode=None, docx_mode=None, pdf_path=None, pages=None, sections=(), docx_builder=None):
+    """Extract red content as positioned image records for the Word builder
+    
+    Skips the intermediate PDF round trip: every rendered block goes straight to
+    an image record with its page, kind and bbox, encoded by region_encoder and
+    looked up in the raster cache before rendering. With docx_mode 'text', text and
+    heading blocks become records of their text runs instead and only tables
+    are rendered. The intermediate PDF is only built when include_pdf is set,
+    in which case (images, pdf_data) is returned; its blocks follow output_mode
+    as in extract_red_pdf_contents, with text blocks always copied as vectors.
+    With pdf_path the PDF is written there a page window at a time and
+    pdf_path is returned in place of pdf_data. pages and sections limit
+    extraction to the selected pages, see _iter_red_pages. With docx_builder,
+    a WordDocumentBuilder, each page's records are added to it as the page
+    completes rather than collected, and docx_builder is returned in place of
+    the records, so they aren't all held until the document is built.
+    """
+    if output_mode is None:
+        output_mode = app.config['PDF_OUTPUT_MODE']
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    text_kinds = _docx_text_kinds(docx_mode)
+    vector = output_mode == 'vector'
+    
+    images = [] if docx_builder is None else docx_builder
+    add_record = images.append if docx_builder is None else docx_builder.add
+    record_count = 0
+    pdf_writer = RedPdfWriter(pdf_path) if include_pdf else None
+    src_doc = open_pdf(pdf_source) if include_pdf and (vector or text_kinds) else None
+    try:
+        for result in _iter_red_pages(pdf_source, workers, progress, text_kinds=text_kinds, encode_images=True,
+                                      pages=pages, sections=sections):
+            if pdf_writer is not None:
+                pdf_writer.add_page(result, src_doc, vector)
+                if result['window_end']:
+                    pdf_writer.flush()
+            for (rect, kind, pix), blocks in zip(result['placements'], result['region_blocks']):
+                add_record(_image_record(result['page_num'], rect, kind, pix, blocks))
+                record_count += 1
+        
+        logger.info("Images extracted", extra={'images': record_count})
+        
+        if pdf_writer is None:
+            return images
+        return images, pdf_writer.close()
+    finally:
+        if src_doc is not None:
+            src_doc.close()
+
+def extract_red_delta(pdf_source, reference_source, original_filename=None, workers=None, include_pdf=False,
+                      progress=None, output_mode=None, docx_mode=None, pdf_path=None, pages=None, sections=(),
+                      reference_progress=None, docx_builder=None):
+    """Extract only the red content that changed since a reference edition
+    
+    Both editions are located without rendering and their regions fingerprinted
+    (see edition_diff); only changed and added regions, plus the headings of
+    their sections, are rasterized or, in docx_mode 'text', kept as text.
+    Returns (images, report), or (images, report, pdf_data) when include_pdf
+    is set; with pdf_path the PDF is written there as in extract_red_images.
+    pdf_data is None when nothing changed, as there is no page to write.
+    pages and sections select the pages compared in both editions, sections
+    being resolved through each edition's own outline. progress is called
+    for the pages of the edition and reference_progress, if given, for those
+    of the reference edition. docx_builder takes the records as in
+    extract_red_images.
+    """
+    if output_mode is None:
+        output_mode = app.config['PDF_OUTPUT_MODE']
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode: {output_mode}")
+    text_kinds = _docx_text_kinds(docx_mode)
+    vector = output_mode == 'vector'
+    
+    located = list(_iter_red_pages(pdf_source, workers, progress, render=False, text_kinds=text_kinds,
+                                   pages=pages, sections=sections))
+    regions = fingerprint_regions(located)
+    reference_regions = fingerprint_regions(_iter_red_pages(reference_source, workers, reference_progress,
+                                                            render=False, pages=pages, sections=sections))
+    report = diff_regions(regions, reference_regions)
+    
+    delta = defaultdict(list)
+    for region in regions:
+        if region['in_delta']:
+            delta[region['page']].append(region['index'])
+    
+    images = [] if docx_builder is None else docx_builder
+    add_record = images.append if docx_builder is None else docx_builder.add
+    record_count = 0
+    pdf_writer = RedPdfWriter(pdf_path) if include_pdf else None
+    doc = open_pdf(pdf_source)
+    raster_start = time.perf_counter()
+    cache_counts = _new_cache_counts()
+    try:
+        for result in located:
+            indexes = delta.get(result['page_num'])
+            if indexes:
+                page = doc[result['page_num']]
+                digest = page_digest(doc, page) if raster_cache is not None else None
+                placements = []
+                for index in indexes:
+                    rect, kind, _ = result['placements'][index]
+                    pix = None
+                    if result['region_blocks'][index] is None:
+                        pix = _cached_region(digest, rect, kind, cache_counts)
+                        if pix is None:
+                            pix = page.get_pixmap(dpi=RENDER_DPI[kind], clip=rect)
+                            pipeline_metrics.inc('app_raster_bytes_total', pix.size)
+                    placements.append((rect, kind, pix))
+                _count_image_bytes(*_encode_placements(placements, digest, []))
+                for index, (rect, kind, pix) in zip(indexes, placements):
+                    add_record(_image_record(result['page_num'], rect, kind, pix, result['region_blocks'][index]))
+                    record_count += 1
+                if pdf_writer is not None:
+                    pdf_writer.add_page(dict(result, placements=placements), doc, vector)
+            if pdf_writer is not None and result['window_end']:
+                pdf_writer.flush()
+        pipeline_metrics.observe('rasterization', time.perf_counter() - raster_start)
+        _count_raster_cache(cache_counts)
+        
+        logger.info("Edition delta extracted", extra={'images': record_count, **report['summary']})
+        
+        if pdf_writer is None:
+            return images, report
+        return images, report, pdf_writer.close()
+    finally:
+        doc.close()
+
 def extract_images_with_positions(pdf_data):
     """Extract images from PDF with their positions"""
     pdf_document = fitz.open(stream=pdf_data, filetype="pdf")
     images = []
     
-    print(f"Extracting images from PDF with {len(pdf_document)} pages...")
+    debug = logger.isEnabledFor(logging.DEBUG)
     
     for page_num in range(len(pdf_document)):
         page = pdf_document.load_page(page_num)
         image_list = page.get_images(full=True)
         
-        print(f"Page {page_num + 1}: Found {len(image_list)} images")
+        if debug:
+            logger.debug("Page images", extra={'page': page_num + 1, 'images': len(image_list)})
         
         for img_index, img in enumerate(image_list):
             xref = img[0]
@@ -194,61 +997,347 @@ def extract_images_with_positions(pdf_data):
                     "width": rect.width,
                     "height": rect.height
                 })
-                print(f"  Image {len(images)}: {rect.width}x{rect.height} at ({rect.x0}, {rect.y0})")
     
-    print(f"Total images extracted: {len(images)}")
+    logger.info("Images extracted", extra={'images': len(images)})
     pdf_document.close()
     return images
 
-def create_word_document_with_positioned_images(images, output_docx_path):
-    """Create Word document with positioned images"""
-    doc = Document()
+def _add_runs(paragraph, runs):
+    previous_text = ""
+    for text, size, bold, italic, color, line_start in runs:
+        # PDF line breaks are layout only, so lines flow on with a space
+        if line_start and previous_text and not previous_text[-1].isspace() and not text[0].isspace():
+            text = " " + text
+        run = paragraph.add_run(text)
+        run.bold = bold
+        run.italic = italic
+        run.font.size = Pt(size)
+        run.font.color.rgb = RGBColor((color >> 16) & 255, (color >> 8) & 255, color & 255)
+        previous_text = text
+
+def _add_text_blocks(doc, record):
+    """Write a text record's blocks as paragraphs of formatted runs
     
-    print(f"Creating Word document with {len(images)} images...")
+    The first visual line of a section heading block, and any all-bold lines
+    after it, become a Word heading; the rest of the block, such as a run-in
+    first paragraph, becomes a normal paragraph.
+    """
+    for (x0, _, _, _), heading_level, lines in record["blocks"]:
+        runs = [run + (run_index == 0,) for _, line in lines for run_index, run in enumerate(line)]
+        heading_runs = 0
+        if heading_level:
+            first_bottom = lines[0][0]
+            for bottom, line in lines:
+                # Section number and title are separate lines sharing a baseline
+                if abs(bottom - first_bottom) > 2 and not all(bold or text.isspace()
+                                                               for text, _, bold, _, _ in line):
+                    break
+                heading_runs += len(line)
+            heading = doc.add_heading(level=min(heading_level, 9))
+            heading.paragraph_format.left_indent = Inches(x0 / DOCX_POINTS_PER_INCH)
+            _add_runs(heading, runs[:heading_runs])
+        if heading_runs < len(runs):
+            paragraph = doc.add_paragraph()
+            paragraph.paragraph_format.left_indent = Inches(x0 / DOCX_POINTS_PER_INCH)
+            _add_runs(paragraph, runs[heading_runs:])
+
+class WordDocumentBuilder:
+    """Word document assembled from positioned image and text records as they are extracted
     
-    if len(images) == 0:
-        print("WARNING: No images found to add to Word document!")
-        # Add a message to the document if no images found
-        doc.add_paragraph("No red text content was found in the PDF file.")
-        doc.add_paragraph("This could mean:")
-        doc.add_paragraph("• The PDF doesn't contain red text")
-        doc.add_paragraph("• The red color doesn't match the expected RGB values")
-        doc.add_paragraph("• The text is embedded as images rather than text")
-    else:
-        for i, image_info in enumerate(images):
-            try:
-                image_bytes = image_info["image_bytes"]
-                x0 = image_info["x0"]
-                width = image_info["width"]
-                height = image_info["height"]
-                
-                print(f"Adding image {i+1}: {width}x{height} at position {x0}")
-                
-                # Add paragraph for the image
-                paragraph = doc.add_paragraph()
-                run = paragraph.add_run()
-                
-                # Add image to paragraph
-                image_stream = BytesIO(image_bytes)
-                # Limit image width to reasonable size (max 6 inches)
-                max_width = min(width / 86, 6.0)
-                run.add_picture(image_stream, width=Inches(max_width))
-                
-                # Set horizontal position
-                paragraph.alignment = 0
-                paragraph.paragraph_format.left_indent = Inches(x0 / 86)
-                
-            except Exception as e:
-                print(f"Error adding image {i+1}: {e}")
+    Records can be added a page at a time, so callers needn't hold every
+    page's encoded images until the document is built; python-docx keeps one
+    copy of each distinct image until save(). image_bytes and raw_image_bytes
+    total the encoded images added and the RGB pixmaps they were made from.
+    With pdf_source, the PDF the records come from, a text record that can't
+    be written is rendered from it and added as an image instead.
+    """
+    
+    def __init__(self, pdf_source=None):
+        self.doc = Document()
+        self.records = 0
+        self.image_bytes = 0
+        self.raw_image_bytes = 0
+        self.build_seconds = 0.0
+        self.pdf_source = pdf_source
+        self._pdf = None
     
-    doc.save(output_docx_path)
-    print(f"Word document saved: {output_docx_path}")
-    return output_docx_path
+    def _add_text(self, record):
+        """Write a text record; on failure remove what was written of it and return False"""
+        body = self.doc.element.body
+        previous = set(body)
+        try:
+            _add_text_blocks(self.doc, record)
+            return True
+        except Exception:
+            logger.warning("Error adding text record", exc_info=True,
+                           extra={'record': self.records, 'page': record["page"] + 1})
+            for element in list(body):
+                if element not in previous:
+                    body.remove(element)
+            return False
+    
+    def _render_record(self, record):
+        """Image record of a text record's region rendered from pdf_source, or None without one"""
+        if self.pdf_source is None:
+            return None
+        if self._pdf is None:
+            self._pdf = open_pdf(self.pdf_source)
+        rect = fitz.Rect(record["x0"], record["y0"], record["x1"], record["y1"])
+        pix = self._pdf[record["page"]].get_pixmap(dpi=RENDER_DPI[record["kind"]], clip=rect)
+        return _image_record(record["page"], rect, record["kind"], pix)
+    
+    def add(self, image_info):
+        """Add one record of _image_record at its horizontal position"""
+        build_start = time.perf_counter()
+        self.records += 1
+        try:
+            if "blocks" in image_info:
+                if self._add_text(image_info):
+                    return
+                image_info = self._render_record(image_info)
+                if image_info is None:
+                    return
+            
+            image_bytes = image_info["image_bytes"]
+            x0 = image_info["x0"]
+            width = image_info["width"]
+            
+            # Add paragraph for the image
+            paragraph = self.doc.add_paragraph()
+            run = paragraph.add_run()
+            
+            # Add image to paragraph
+            image_stream = BytesIO(image_bytes)
+            # Limit image width to reasonable size (max 6 inches)
+            max_width = min(width / DOCX_POINTS_PER_INCH, 6.0)
+            run.add_picture(image_stream, width=Inches(max_width))
+            
+            # Set horizontal position
+            paragraph.alignment = 0
+            paragraph.paragraph_format.left_indent = Inches(x0 / DOCX_POINTS_PER_INCH)
+            
+            self.image_bytes += len(image_bytes)
+            self.raw_image_bytes += raw_size(image_bytes)
+        except Exception:
+            logger.warning("Error adding image", exc_info=True, extra={'image': self.records})
+        finally:
+            self.build_seconds += time.perf_counter() - build_start
+    
+    def save(self, output_docx_path, empty_text=None):
+        """Write the document; empty_text replaces the no-content notice when no record was added"""
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+        if self.records == 0 and empty_text is not None:
+            self.doc.add_paragraph(empty_text)
+        elif self.records == 0:
+            logger.warning("No images found to add to Word document", extra={'path': output_docx_path})
+            # Add a message to the document if no images found
+            self.doc.add_paragraph("No red text content was found in the PDF file.")
+            self.doc.add_paragraph("This could mean:")
+            self.doc.add_paragraph("• The PDF doesn't contain red text")
+            self.doc.add_paragraph("• The red color doesn't match the expected RGB values")
+            self.doc.add_paragraph("• The text is embedded as images rather than text")
+        
+        pipeline_metrics.observe('docx_build', self.build_seconds)
+        with pipeline_metrics.time('save'):
+            self.doc.save(output_docx_path)
+        logger.info("Word document saved", extra={'path': output_docx_path, 'images': self.records})
+        return output_docx_path
+
+def create_word_document_with_positioned_images(images, output_docx_path, empty_text=None):
+    """Create Word document with positioned images and text records; empty_text replaces the no-content notice"""
+    builder = WordDocumentBuilder()
+    for image_info in images:
+        builder.add(image_info)
+    return builder.save(output_docx_path, empty_text)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def result_cache_key(pdf_hash, pages=None, sections=()):
+    """Result cache key of a PDF's Word document, for the whole document or a page selection"""
+    settings = extraction_settings()
+    if pages or sections:
+        settings.update(pages=pages, sections=list(sections))
+    return ResultCache.make_key(pdf_hash, settings)
+
+def word_output_name(job_id, filename, delta=False):
+    """File name of the Word document made from an uploaded PDF"""
+    base_name = filename.rsplit('.', 1)[0]
+    prefix = 'word_delta' if delta else 'word_output'
+    word_filename = f"{prefix}_{base_name}.docx"
+    # Limit filename length to avoid path issues
+    if len(word_filename) > 50:
+        word_filename = f"{prefix}_{base_name[:20]}.docx"
+    return f"{job_id}_{word_filename}"
+
+def serve_cached_upload(job_id, pdf_files, pages=None, sections=()):
+    """Complete an upload whose Word documents are all in the result cache, without queueing a job
+    
+    Returns False, leaving no job or output behind, if an entry was evicted
+    since it was looked up.
+    """
+    files = []
+    for filename, _, pdf_hash in pdf_files:
+        word_file = word_output_name(job_id, filename)
+        word_path = os.path.join(app.config['OUTPUT_FOLDER'], word_file)
+        if not result_cache.get(result_cache_key(pdf_hash, pages, sections), word_path):
+            for file_info in files:
+                os.remove(os.path.join(app.config['OUTPUT_FOLDER'], file_info['word_file']))
+            return False
+        files.append({'original_name': filename, 'status': 'completed', 'pages_done': 0, 'pages_total': None,
+                      'word_file': word_file, 'cached': True, 'input_sha256': pdf_hash})
+    for file_info in files:
+        job_store.add_output(job_id, file_info['word_file'],
+                             os.path.getsize(os.path.join(app.config['OUTPUT_FOLDER'], file_info['word_file'])),
+                             file_info['original_name'], file_info['input_sha256'])
+    job_store.add_completed(job_id, files)
+    logger.info("Upload served from the result cache", extra={'job_id': job_id, 'files': len(files)})
+    return True
+
+def process_upload_job(job_id, payload, progress):
+    """Run the extraction pipeline for every file of an upload job"""
+    try:
+        _process_upload_files(job_id, payload, progress)
+    finally:
+        pipeline_metrics.flush()
+        remove_spooled_uploads(payload['files'])
+        if payload['reference'] is not None:
+            remove_spooled_uploads([payload['reference']])
+
+def _process_upload_files(job_id, payload, progress):
+    # The intermediate red-content PDF is only produced when asked for
+    include_pdf = payload['include_pdf']
+    # With a reference edition only the changed red content is extracted
+    reference = payload['reference']
+    # Page ranges and outline sections to extract; payloads queued before they existed have neither
+    selection = {'pages': payload.get('pages'), 'sections': payload.get('sections') or ()}
+    
+    for index, (filename, upload_path, pdf_hash) in enumerate(payload['files']):
+        progress.start_file(index)
+        base_name = filename.rsplit('.', 1)[0]
+        
+        # Create Word document
+        word_file = word_output_name(job_id, filename, delta=reference is not None)
+        word_path = os.path.join(app.config['OUTPUT_FOLDER'], word_file)
+        file_info = {'word_file': word_file}
+        
+        # Reuse the document from an earlier upload of the same PDF
+        cache_key = None
+        cached = False
+        if result_cache is not None and not include_pdf and reference is None:
+            cache_key = result_cache_key(pdf_hash, **selection)
+            cached = result_cache.get(cache_key, word_path)
+        
+        if cached:
+            logger.info("Result cache hit", extra={'job_id': job_id, 'file': filename})
+        else:
+            def page_progress(pages_done, pages_total, red_blocks, index=index):
+                progress.page_done(index, pages_done, pages_total, red_blocks)
+            
+            # Extract red content straight to positioned images; the PDF is written out a window at a time
+            pdf_filename = f"{job_id}_red_content_{base_name[:20]}.pdf"
+            pdf_path = os.path.join(app.config['OUTPUT_FOLDER'], pdf_filename)
+            pdf_output = None
+            # Each page's images go into the Word document as the page is extracted
+            docx_builder = WordDocumentBuilder(upload_path)
+            if reference is not None:
+                reference_name, reference_path, _ = reference
+                # The reference pass reports no progress of its own but still stops at the deadline
+                delta = extract_red_delta(upload_path, reference_path, filename, include_pdf=include_pdf,
+                                          progress=page_progress, pdf_path=pdf_path,
+                                          reference_progress=lambda *_: progress.check_deadline(),
+                                          docx_builder=docx_builder, **selection)
+                report = delta[1]
+                if include_pdf:
+                    pdf_output = delta[2]
+                report.update({'edition': filename, 'reference': reference_name})
+                report_filename = f"{job_id}_changes_{base_name[:20]}.json"
+                report_path = os.path.join(app.config['OUTPUT_FOLDER'], report_filename)
+                with open(report_path, 'w') as report_file:
+                    json.dump(report, report_file, indent=2)
+                job_store.add_output(job_id, report_filename, os.path.getsize(report_path), filename, pdf_hash)
+                file_info['report_file'] = report_filename
+                file_info['changes'] = report['summary']
+            elif include_pdf:
+                _, pdf_output = extract_red_images(upload_path, filename, include_pdf=True, progress=page_progress,
+                                                   pdf_path=pdf_path, docx_builder=docx_builder, **selection)
+            else:
+                extract_red_images(upload_path, filename, progress=page_progress, docx_builder=docx_builder,
+                                   **selection)
+            
+            # An empty edition delta has no red-content PDF
+            if pdf_output is not None:
+                job_store.add_output(job_id, pdf_filename, os.path.getsize(pdf_path), filename, pdf_hash)
+                file_info['pdf_file'] = pdf_filename
+            
+            # Size of the Word document's images, and what encoding saved over their raw RGB rasters
+            file_info['image_bytes'] = docx_builder.image_bytes
+            file_info['image_bytes_saved'] = docx_builder.raw_image_bytes - docx_builder.image_bytes
+            
+            empty_text = "No red content changed since the reference edition." if reference is not None else None
+            docx_builder.save(word_path, empty_text)
+            
+            if cache_key is not None:
+                result_cache.put(cache_key, word_path)
+        
+        job_store.add_output(job_id, file_info['word_file'], os.path.getsize(word_path), filename, pdf_hash)
+        progress.finish_file(index, cached=cached, input_sha256=pdf_hash, **file_info)
+
+job_store = JobStore(app.config['JOB_DB_PATH'], app.config['PROCESSING_TIMEOUT'], app.config['QUEUE_TIMEOUT'])
+job_queue = JobQueue(job_store, process_upload_job, app.config['MAX_CONCURRENT_JOBS'], _extract_context)
+output_reaper = OutputReaper(job_store, [app.config['OUTPUT_FOLDER'], app.config['UPLOAD_FOLDER']],
+                             app.config['CLEANUP_INTERVAL'], app.config['MAX_FILE_AGE'])
+
+def spool_upload(file, upload_path, chunk_size=1024 * 1024):
+    """Stream an uploaded file to disk in chunks; returns its SHA-256 hex digest"""
+    sha256 = hashlib.sha256()
+    with open(upload_path, 'wb') as spool_file:
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            spool_file.write(chunk)
+    return sha256.hexdigest()
+
+def estimate_pdf_cost(path, pages=None, sections=()):
+    """Admission cost of extracting a spooled PDF, in page-equivalents
+    
+    Only the PDF's cross-reference table and page tree are read. Each selected
+    page costs 1 plus its share of the file size at ADMISSION_COST_PER_MB, as
+    large files are mostly costly images and fonts. Raises ValueError if the
+    page selection doesn't resolve.
+    """
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    with fitz.open(path, filetype="pdf") as doc:
+        selected = select_pages(doc, pages, sections)
+        page_count = doc.page_count
+    selected_count = page_count if selected is None else len(selected)
+    return selected_count * (1 + app.config['ADMISSION_COST_PER_MB'] * size_mb / max(page_count, 1))
+
+def admission_retry_after(cost):
+    """Seconds until enough in-flight work should drain for a job of this cost to be admitted"""
+    backlog = job_store.in_flight_cost() - max(app.config['ADMISSION_BUDGET'] - cost, 0)
+    seconds = math.ceil(max(backlog, 0) / app.config['ADMISSION_COST_PER_SECOND'])
+    return min(max(seconds, 1), app.config['PROCESSING_TIMEOUT'])
+
+def remove_spooled_uploads(files):
+    for _, upload_path, _ in files:
+        try:
+            os.remove(upload_path)
+        except FileNotFoundError:
+            pass
+
+@app.before_request
+def start_background_threads():
+    # Started from the first request so each gunicorn worker gets its own threads after fork; the job
+    # threads also pick up jobs left queued by workers that exited
+    output_reaper.start()
+    job_queue.start()
+
 @app.route('/upload', methods=['POST'])
 def upload_files():
     if 'files' not in request.files:
@@ -258,59 +1347,99 @@ def upload_files():
     if not files or all(file.filename == '' for file in files):
         return jsonify({'error': 'No files selected'}), 400
     
-    processed_files = []
     job_id = str(uuid.uuid4())
+    include_pdf = request.form.get('include_pdf', 'false').lower() == 'true'
+    reference_file = request.files.get('reference')
+    if reference_file is not None and reference_file.filename == '':
+        reference_file = None
+    if reference_file is not None and not allowed_file(reference_file.filename):
+        return jsonify({'error': 'Reference edition must be a PDF file'}), 400
+    # Optional page ranges ("3-5, 9") and outline section titles limiting what is extracted
+    pages = request.form.get('pages', '').strip() or None
+    sections = [name.strip() for name in request.form.getlist('section') if name.strip()]
     
+    pdf_files = []
+    reference = None
     try:
         for file in files:
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                base_name = filename.rsplit('.', 1)[0]
-                
-                # Read PDF data
-                pdf_data = file.read()
-                
-                # Extract red content
-                processed_pdf_data = extract_red_pdf_contents(pdf_data, filename)
-                
-                # Extract images from processed PDF
-                images = extract_images_with_positions(processed_pdf_data)
-                
-                # Create Word document
-                word_filename = f"word_output_{base_name}.docx"
-                # Limit filename length to avoid path issues
-                if len(word_filename) > 50:
-                    word_filename = f"word_output_{base_name[:20]}.docx"
-                
-                word_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{job_id}_{word_filename}")
-                print(f"Creating Word document at: {word_path}")
-                
-                create_word_document_with_positioned_images(images, word_path)
-                print(f"Word document created successfully: {os.path.exists(word_path)}")
-                
-                processed_files.append({
-                    'original_name': filename,
-                    'word_file': f"{job_id}_{word_filename}",
-                    'status': 'completed'
-                })
+                # Spool to disk; the background job opens the PDF from there
+                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{len(pdf_files)}.pdf")
+                pdf_hash = spool_upload(file, upload_path)
+                pdf_files.append((secure_filename(file.filename), upload_path, pdf_hash))
+        
+        if not pdf_files:
+            return jsonify({'error': 'No PDF files selected'}), 400
+        
+        if reference_file is not None:
+            reference_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_reference.pdf")
+            reference = (secure_filename(reference_file.filename), reference_path,
+                         spool_upload(reference_file, reference_path))
+        
+        # A reference edition is located page by page too, so it counts towards the cost
+        spooled = pdf_files + ([reference] if reference is not None else [])
+        cost = 0
+        cached_files = 0
+        for name, upload_path, pdf_hash in spooled:
+            if (result_cache is not None and not include_pdf and reference is None and
+                    result_cache.contains(result_cache_key(pdf_hash, pages, sections))):
+                # Served from the result cache without extraction
+                cached_files += 1
+                continue
+            try:
+                cost += estimate_pdf_cost(upload_path, pages, sections)
+            except ValueError as e:
+                # Reject selections that don't resolve now rather than failing the job later
+                remove_spooled_uploads(spooled)
+                return jsonify({'error': f'{name}: {e}'}), 400
+        
+        # Nothing to extract: answer now rather than wait in the queue behind jobs that do
+        if cached_files == len(spooled) and serve_cached_upload(job_id, pdf_files, pages, sections):
+            remove_spooled_uploads(spooled)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'completed',
+                'files': [{'original_name': name, 'status': 'completed'} for name, _, _ in pdf_files],
+                'message': f'Served {len(pdf_files)} files from the result cache'
+            }), 200
+        
+        admitted = job_queue.submit(job_id, [name for name, _, _ in pdf_files],
+                                    {'files': pdf_files, 'include_pdf': include_pdf, 'reference': reference,
+                                     'pages': pages, 'sections': sections},
+                                    cost=cost, budget=app.config['ADMISSION_BUDGET'])
+        if not admitted:
+            remove_spooled_uploads(spooled)
+            retry_after = admission_retry_after(cost)
+            pipeline_metrics.inc('app_uploads_rejected_total')
+            # Flush now, since a scrape answered by another worker wouldn't flush this one's counters
+            pipeline_metrics.flush()
+            logger.warning("Upload rejected, admission budget full",
+                           extra={'cost': round(cost, 1), 'budget': app.config['ADMISSION_BUDGET'],
+                                  'retry_after': retry_after})
+            response = jsonify({'error': f'Server is busy, please retry in {retry_after} seconds',
+                                'retry_after': retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
         
         return jsonify({
             'success': True,
             'job_id': job_id,
-            'files': processed_files,
-            'message': f'Successfully processed {len(processed_files)} files'
-        })
+            'status': 'queued',
+            'files': [{'original_name': name, 'status': 'queued'} for name, _, _ in pdf_files],
+            'message': f'Queued {len(pdf_files)} files for processing'
+        }), 202
     
     except Exception as e:
+        remove_spooled_uploads(pdf_files + ([reference] if reference is not None else []))
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
 @app.route('/test_download')
 def test_download():
     """Test route to check if downloads work"""
     try:
-        output_files = os.listdir(app.config['OUTPUT_FOLDER'])
-        if output_files:
-            test_file = output_files[0]
+        test_file = job_store.latest_output()
+        if test_file:
             file_path = os.path.join(app.config['OUTPUT_FOLDER'], test_file)
             return send_file(file_path, as_attachment=True, download_name=test_file)
         else:
@@ -322,46 +1451,75 @@ def test_download():
 def download_file(filename):
     try:
         file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        print(f"Download request for: {filename}")
-        print(f"Looking for file at: {file_path}")
-        print(f"File exists: {os.path.exists(file_path)}")
         
         if os.path.exists(file_path):
-            print(f"File size: {os.path.getsize(file_path)} bytes")
+            logger.info("Download", extra={'file': filename, 'bytes': os.path.getsize(file_path)})
             return send_file(file_path, as_attachment=True, download_name=filename)
         else:
-            print(f"File not found! Files in output folder:")
-            if os.path.exists(app.config['OUTPUT_FOLDER']):
-                for f in os.listdir(app.config['OUTPUT_FOLDER']):
-                    print(f"  - {f}")
-            else:
-                print(f"Output folder doesn't exist: {app.config['OUTPUT_FOLDER']}")
+            logger.warning("Download file not found", extra={'file': filename, 'path': file_path,
+                                                             'output_folder_exists': os.path.exists(app.config['OUTPUT_FOLDER'])})
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
-        print(f"Download error: {str(e)}")
+        logger.exception("Download error", extra={'file': filename})
         return jsonify({'error': str(e)}), 500
 
+class _ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink that hands written ZIP bytes back to a response generator"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def iter_zip_stream(entries, chunk_size=64 * 1024):
+    """Yield a ZIP archive of (path, archive_name) entries as it is written
+    
+    Entries are stored without recompression (DOCX files are already zipped)
+    and read in chunks, so memory use doesn't depend on the archive size.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for file_path, archive_name in entries:
+            info = zipfile.ZipInfo.from_file(file_path, archive_name)
+            with open(file_path, 'rb') as src, zip_file.open(info, 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    # Central directory
+    yield buffer.pop()
+
 @app.route('/download_all/<job_id>')
 def download_all(job_id):
     try:
-        # Create zip file with all processed documents
-        zip_buffer = BytesIO()
+        # Stream a zip file with all processed documents
+        entries = []
+        for filename in job_store.outputs(job_id):
+            file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
+            if os.path.exists(file_path):
+                # Remove job_id prefix from filename in zip
+                entries.append((file_path, filename.replace(f"{job_id}_", "")))
         
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for filename in os.listdir(app.config['OUTPUT_FOLDER']):
-                if filename.startswith(job_id):
-                    file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-                    # Remove job_id prefix from filename in zip
-                    archive_name = filename.replace(f"{job_id}_", "")
-                    zip_file.write(file_path, archive_name)
+        if not entries:
+            return jsonify({'error': 'No files found for job'}), 404
         
-        zip_buffer.seek(0)
-        
-        return send_file(
-            zip_buffer,
+        return Response(
+            stream_with_context(iter_zip_stream(entries)),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'extracted_documents_{job_id}.zip'
+            headers={'Content-Disposition': f'attachment; filename=extracted_documents_{job_id}.zip'}
         )
     
     except Exception as e:
@@ -370,12 +1528,82 @@ def download_all(job_id):
 @app.route('/status/<job_id>')
 def get_status(job_id):
     # Check status of processing job
-    files_in_output = [f for f in os.listdir(app.config['OUTPUT_FOLDER']) if f.startswith(job_id)]
-    return jsonify({
-        'job_id': job_id,
-        'status': 'completed' if files_in_output else 'processing',
-        'files_count': len(files_in_output)
-    })
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    job['files_count'] = len([f for f in job['files'] if f['status'] == 'completed'])
+    return jsonify(job)
+
+def _sse(event_type, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event_type}", f"data: {data}"]
+    return '\n'.join(lines) + '\n\n'
+
+def iter_job_events(job_id, after_id):
+    """Server-sent events of a job until it completes or fails
+    
+    A fresh connection starts with a 'status' snapshot of the job; a reconnect
+    with Last-Event-ID replays the events it missed. The event log is read
+    from the job store, so any worker can serve the stream.
+    """
+    yield f"retry: {EVENT_RETRY_MS}\n\n"
+    if after_id is None:
+        after_id = job_store.last_event_id(job_id)
+        job = job_store.get(job_id)
+        if job is None:
+            # Expired since the stream was opened
+            yield _sse('job_failed', json.dumps({'error': 'Job not found'}))
+            return
+        yield _sse('status', json.dumps(job))
+        if job['status'] in ('completed', 'failed'):
+            return
+    
+    idle_since = time.time()
+    while True:
+        events = job_store.events(job_id, after_id)
+        for event_id, event_type, data in events:
+            yield _sse(event_type, data, event_id)
+            after_id = event_id
+            if event_type in ('job_completed', 'job_failed'):
+                return
+        
+        if events:
+            idle_since = time.time()
+        elif time.time() - idle_since >= EVENT_HEARTBEAT_INTERVAL:
+            # Refresh the queue position and notice jobs whose worker died
+            job = job_store.get(job_id)
+            if job is None or job['status'] == 'failed':
+                yield _sse('job_failed', json.dumps({'error': job['error'] if job else 'Job not found'}))
+                return
+            yield _sse('status', json.dumps(job))
+            idle_since = time.time()
+        time.sleep(EVENT_POLL_INTERVAL)
+
+@app.route('/events/<job_id>')
+def job_events(job_id):
+    """Stream a job's progress as server-sent events
+    
+    At most MAX_EVENT_STREAMS streams are open per worker; past that the
+    stream is refused with 503 and clients poll /status instead.
+    """
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not event_stream_slots.acquire(blocking=False):
+        logger.info("Event stream refused, poll /status instead", extra={'job_id': job_id})
+        response = jsonify({'error': 'Too many event streams, poll the status URL instead',
+                            'status_url': url_for('get_status', job_id=job_id)})
+        response.headers['Retry-After'] = str(EVENT_RETRY_MS // 1000)
+        return response, 503
+    
+    last_event_id = request.headers.get('Last-Event-ID')
+    after_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    response = Response(stream_with_context(iter_job_events(job_id, after_id)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # The server closes the response when the stream ends or the client goes away, even if it never started
+    response.call_on_close(event_stream_slots.release)
+    return response
 
 # ============================================================================
 # HEALTH MONITORING ENDPOINTS
@@ -500,7 +1728,7 @@ def metrics():
     try:
         # Count files in upload and output folders
         upload_files = len([f for f in os.listdir(app.config['UPLOAD_FOLDER']) if os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))])
-        output_files = len([f for f in os.listdir(app.config['OUTPUT_FOLDER']) if os.path.isfile(os.path.join(app.config['OUTPUT_FOLDER'], f))])
+        output_stats = job_store.output_stats()
         
         uptime = int(time.time() - APP_START_TIME)
         
@@ -514,7 +1742,80 @@ app_upload_files_total {upload_files}
 
 # HELP app_output_files_total Total number of files in output folder
 # TYPE app_output_files_total gauge
-app_output_files_total {output_files}
+app_output_files_total {output_stats['files']}
+
+# HELP app_output_bytes_total Total size of files in output folder
+# TYPE app_output_bytes_total gauge
+app_output_bytes_total {output_stats['bytes']}
+"""
+        
+        job_counts = job_store.count_by_status()
+        metrics_text += f"""
+# HELP app_jobs_in_flight Jobs currently being processed across all workers
+# TYPE app_jobs_in_flight gauge
+app_jobs_in_flight {job_counts.get('processing', 0)}
+
+# HELP app_jobs_queued Jobs waiting for a processing slot
+# TYPE app_jobs_queued gauge
+app_jobs_queued {job_counts.get('queued', 0)}
+
+# HELP app_admission_in_flight_cost Estimated page-equivalents of the jobs queued or processing
+# TYPE app_admission_in_flight_cost gauge
+app_admission_in_flight_cost {job_store.in_flight_cost():.1f}
+
+# HELP app_admission_budget Page-equivalents admitted at once before uploads get 429; 0 means unlimited
+# TYPE app_admission_budget gauge
+app_admission_budget {app.config['ADMISSION_BUDGET']:g}
+
+""" + pipeline_metrics.render()
+        
+        if result_cache is not None:
+            cache_stats = result_cache.stats()
+            metrics_text += f"""
+# HELP app_result_cache_hits_total Uploads served from the result cache
+# TYPE app_result_cache_hits_total counter
+app_result_cache_hits_total {cache_stats['hits']}
+
+# HELP app_result_cache_misses_total Uploads that required full processing
+# TYPE app_result_cache_misses_total counter
+app_result_cache_misses_total {cache_stats['misses']}
+
+# HELP app_result_cache_evictions_total Cache entries evicted to stay under the size limit
+# TYPE app_result_cache_evictions_total counter
+app_result_cache_evictions_total {cache_stats['evictions']}
+
+# HELP app_result_cache_entries Number of cached documents
+# TYPE app_result_cache_entries gauge
+app_result_cache_entries {cache_stats['entries']}
+
+# HELP app_result_cache_bytes Total size of cached documents in bytes
+# TYPE app_result_cache_bytes gauge
+app_result_cache_bytes {cache_stats['bytes']}
+"""
+        
+        if raster_cache is not None:
+            counters = pipeline_metrics.counters()
+            raster_hits = counters['app_raster_cache_memory_hits_total'] + counters['app_raster_cache_disk_hits_total']
+            raster_lookups = raster_hits + counters['app_raster_cache_misses_total']
+            metrics_text += f"""
+# HELP app_raster_cache_hit_ratio Share of raster cache lookups served without rendering, across all workers
+# TYPE app_raster_cache_hit_ratio gauge
+app_raster_cache_hit_ratio {raster_hits / raster_lookups if raster_lookups else 0:.4f}
+"""
+            if raster_cache.disk is not None:
+                disk_stats = raster_cache.disk.stats()
+                metrics_text += f"""
+# HELP app_raster_cache_disk_entries Regions in the shared on-disk raster cache
+# TYPE app_raster_cache_disk_entries gauge
+app_raster_cache_disk_entries {disk_stats['entries']}
+
+# HELP app_raster_cache_disk_bytes Size of the shared on-disk raster cache in bytes
+# TYPE app_raster_cache_disk_bytes gauge
+app_raster_cache_disk_bytes {disk_stats['bytes']}
+
+# HELP app_raster_cache_disk_evictions_total Regions evicted from the on-disk raster cache
+# TYPE app_raster_cache_disk_evictions_total counter
+app_raster_cache_disk_evictions_total {disk_stats['evictions']}
 """
         
         if PSUTIL_AVAILABLE:
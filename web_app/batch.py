@@ -0,0 +1,196 @@
+"""Convert a directory tree of rule PDFs to Word documents without the web app
+
+Every PDF under INPUT_DIR goes through the same pipeline as an upload job and
+its Word document is written to the same relative path under OUTPUT_DIR.
+Files are spread over a pool of processes. Each converted or failed file is
+appended to a checkpoint manifest, so rerunning after an interruption skips
+the files already converted with the same settings and retries the rest.
+
+Usage:
+    python batch.py INPUT_DIR OUTPUT_DIR [--processes 4] [--include-pdf] [--docx-mode text]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import app
+
+MANIFEST_NAME = 'batch_manifest.jsonl'
+
+
+def find_pdfs(input_dir, skip_dir=None):
+    """Paths of the PDFs under input_dir relative to it, sorted, leaving out skip_dir"""
+    found = []
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        dir_names[:] = sorted(name for name in dir_names
+                              if os.path.abspath(os.path.join(dir_path, name)) != skip_dir)
+        for file_name in sorted(file_names):
+            if app.allowed_file(file_name):
+                found.append(os.path.relpath(os.path.join(dir_path, file_name), input_dir))
+    return found
+
+
+def settings_key(include_pdf):
+    """Short digest of everything that changes a file's outputs"""
+    settings = dict(app.extraction_settings(), include_pdf=include_pdf,
+                    pdf_output_mode=app.app.config['PDF_OUTPUT_MODE'] if include_pdf else None)
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def output_paths(rel_path, include_pdf):
+    """Output files of one input, relative to the output directory"""
+    base = os.path.splitext(rel_path)[0]
+    outputs = [f"{base}.docx"]
+    if include_pdf:
+        outputs.append(f"{base}_red_content.pdf")
+    return outputs
+
+
+def load_manifest(manifest_path):
+    """Latest manifest record of each input; a line torn by an interrupted run is ignored"""
+    records = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as manifest:
+            for line in manifest:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                records[record['path']] = record
+    return records
+
+
+def is_converted(record, stat, settings, output_dir):
+    """Whether a manifest record shows this exact file already converted with these settings"""
+    return (record is not None and record['status'] == 'done' and record['settings'] == settings and
+            record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns and
+            all(os.path.exists(os.path.join(output_dir, output)) for output in record['outputs']))
+
+
+def append_record(manifest, record):
+    # One flushed line per file, so a crash loses at most the file in progress
+    manifest.write(json.dumps(record) + '\n')
+    manifest.flush()
+    os.fsync(manifest.fileno())
+
+
+def _init_worker(docx_mode, log_level):
+    app.app.config['DOCX_OUTPUT_MODE'] = docx_mode
+    logging.getLogger().setLevel(log_level)
+
+
+def convert_file(input_path, docx_path, pdf_path=None):
+    """Worker entry point: convert one PDF; returns (pages, seconds)"""
+    start = time.perf_counter()
+    page_count = [0]
+
+    def progress(pages_done, pages_total, red_blocks):
+        page_count[0] = pages_total
+
+    os.makedirs(os.path.dirname(docx_path) or '.', exist_ok=True)
+    name = os.path.basename(input_path)
+    docx_builder = app.WordDocumentBuilder(input_path)
+    app.extract_red_images(input_path, name, workers=1, include_pdf=pdf_path is not None, progress=progress,
+                           pdf_path=pdf_path, docx_builder=docx_builder)
+    docx_builder.save(docx_path)
+    return page_count[0], time.perf_counter() - start
+
+
+def run_batch(input_dir, output_dir, processes, include_pdf=False, docx_mode=None, manifest_path=None,
+              log_level=logging.WARNING):
+    """Convert the PDFs under input_dir that the manifest doesn't list as done; returns an exit status"""
+    if docx_mode is None:
+        docx_mode = app.app.config['DOCX_OUTPUT_MODE']
+    app.app.config['DOCX_OUTPUT_MODE'] = docx_mode
+    os.makedirs(output_dir, exist_ok=True)
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+    settings = settings_key(include_pdf)
+    records = load_manifest(manifest_path)
+    pending = []
+    skipped = 0
+    for rel_path in find_pdfs(input_dir, skip_dir=os.path.abspath(output_dir)):
+        stat = os.stat(os.path.join(input_dir, rel_path))
+        if is_converted(records.get(rel_path), stat, settings, output_dir):
+            skipped += 1
+        else:
+            pending.append((rel_path, stat))
+    print(f"{len(pending) + skipped} PDFs found, {skipped} already converted, {len(pending)} to convert")
+
+    converted = 0
+    pages = 0
+    failures = []
+    interrupted = False
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                   initargs=(docx_mode, log_level))
+    try:
+        with open(manifest_path, 'a', encoding='utf-8') as manifest:
+            futures = {}
+            for rel_path, stat in pending:
+                outputs = output_paths(rel_path, include_pdf)
+                paths = [os.path.join(output_dir, output) for output in outputs]
+                future = executor.submit(convert_file, os.path.join(input_dir, rel_path), *paths)
+                futures[future] = (rel_path, stat, outputs)
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                rel_path, stat, outputs = futures[future]
+                record = {'path': rel_path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                          'settings': settings}
+                try:
+                    file_pages, seconds = future.result()
+                except Exception as e:
+                    record.update({'status': 'failed', 'error': str(e)})
+                    failures.append((rel_path, str(e)))
+                    print(f"[{done}/{len(pending)}] {rel_path}: FAILED ({e})")
+                else:
+                    record.update({'status': 'done', 'pages': file_pages, 'seconds': round(seconds, 3),
+                                   'outputs': outputs})
+                    converted += 1
+                    pages += file_pages
+                    print(f"[{done}/{len(pending)}] {rel_path}: {file_pages} pages in {seconds:.1f}s")
+                append_record(manifest, record)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted; converted files are recorded in the manifest and skipped on the next run")
+    finally:
+        executor.shutdown(wait=not interrupted, cancel_futures=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{converted} converted, {skipped} skipped, {len(failures)} failed in {elapsed:.1f}s "
+          f"with {processes} processes")
+    if elapsed > 0:
+        print(f"{converted / elapsed:.2f} files/s, {pages / elapsed:.1f} pages/s")
+    for rel_path, error in failures:
+        print(f"  failed: {rel_path}: {error}")
+    if interrupted:
+        return 130
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a directory tree of PDFs to Word documents')
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help='files converted at once (default: CPU count)')
+    parser.add_argument('--include-pdf', action='store_true', help='also write the red-content PDF of each file')
+    parser.add_argument('--docx-mode', choices=app.DOCX_OUTPUT_MODES, help='default: DOCX_OUTPUT_MODE')
+    parser.add_argument('--manifest', help=f'checkpoint manifest (default: OUTPUT_DIR/{MANIFEST_NAME})')
+    parser.add_argument('--verbose', action='store_true', help='keep the pipeline\'s INFO logs')
+    args = parser.parse_args()
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.getLogger().setLevel(log_level)
+    sys.exit(run_batch(args.input_dir, args.output_dir, args.processes, args.include_pdf, args.docx_mode,
+                       args.manifest, log_level))
+
+
+if __name__ == '__main__':
+    main()
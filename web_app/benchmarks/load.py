@@ -0,0 +1,365 @@
+"""Load test the service under gunicorn: throughput, tail latency, error rates and per-worker RSS
+
+Starts the app under gunicorn in a scratch directory, then runs upload
+clients that each loop over: POST /upload, poll /status until the job
+finishes, GET /download_all. Uploads cycle through the sample PDF and
+synthetic PDFs of the given page counts. A probe client meanwhile times
+/health to show how lightweight endpoints hold up. Uploads refused with
+429 wait for Retry-After. Clients stop starting uploads after --duration
+and finish the job they are on; throughput is measured over the whole run.
+
+The result and raster caches are off unless --caches is given, so repeated
+uploads of the same PDFs measure the pipeline rather than cache lookups.
+
+Usage:
+    python benchmarks/load.py --workers 4 --threads 8 --clients 8 --duration 60 --json load.json
+    python benchmarks/load.py --synthetic-pages 20 200 --env EXTRACTION_WORKERS=2 --env ADMISSION_BUDGET=0
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import signal
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import psutil
+
+from _env import WEB_APP_DIR, storage_env
+
+DEFAULT_PDF = os.path.join(WEB_APP_DIR, '..', '1-mvr-part-4-jul24_436.pdf')
+
+ENDPOINTS = ('upload', 'status', 'download_all', 'health')
+
+# Longest wait between /status polls while they fail
+MAX_POLL_INTERVAL = 8
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values, q in 0-100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def multipart(files, fields=()):
+    """multipart/form-data body and content type for (field, filename, data) files and (name, value) fields"""
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+             for name, value in fields]
+    for field, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/pdf\r\n\r\n'.encode('utf-8') + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Recorder:
+    """Latencies and outcomes of every request, plus finished jobs, shared by the client threads"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.samples = {endpoint: [] for endpoint in ENDPOINTS}
+        self.jobs = {'completed': 0, 'failed': 0, 'timed_out': 0, 'pages': 0, 'seconds': []}
+        self.download_bytes = 0
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, url, body=None, headers=None):
+        """(status, body bytes, headers) of a request, status None if it failed without a response"""
+        request = urllib.request.Request(url, data=body, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, data, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, data, response_headers = e.code, e.read(), e.headers
+        except (OSError, urllib.error.URLError):
+            status, data, response_headers = None, b'', {}
+        with self._lock:
+            self.samples[endpoint].append((time.perf_counter() - start, status))
+        return status, data, response_headers
+
+    def downloaded(self, size):
+        with self._lock:
+            self.download_bytes += size
+
+    def job_finished(self, status, pages, seconds):
+        with self._lock:
+            self.jobs[status] += 1
+            if status == 'completed':
+                self.jobs['pages'] += pages
+                self.jobs['seconds'].append(seconds)
+
+
+def wait_for_job(base_url, job_id, poll_interval, job_timeout, recorder):
+    """Poll /status until a job ends; returns 'completed', 'failed' or 'timed_out'
+
+    An unknown job (404) counts as failed. Polls that get no answer or an
+    error back off, doubling the interval up to MAX_POLL_INTERVAL.
+    """
+    job_deadline = time.time() + job_timeout
+    interval = poll_interval
+    while True:
+        time.sleep(min(interval, max(job_deadline - time.time(), 0)))
+        if time.time() >= job_deadline:
+            return 'timed_out'
+        status, data, _ = recorder.request('status', f'{base_url}/status/{job_id}')
+        if status == 404:
+            return 'failed'
+        if status == 200:
+            job_status = json.loads(data)['status']
+            if job_status in ('completed', 'failed'):
+                return job_status
+            interval = poll_interval
+        else:
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+def run_uploader(client, base_url, pdfs, files_per_upload, deadline, poll_interval, job_timeout, recorder):
+    """Upload, poll and download until the deadline, finishing the job in progress"""
+    index = client
+    while time.time() < deadline:
+        batch = [pdfs[(index + offset) % len(pdfs)] for offset in range(files_per_upload)]
+        index += files_per_upload
+        body, content_type = multipart([('files', name, data) for name, data, _ in batch])
+        status, data, headers = recorder.request('upload', f'{base_url}/upload', body, {'Content-Type': content_type})
+        if status == 429:
+            time.sleep(min(float(headers.get('Retry-After', 1)), max(deadline - time.time(), 0)))
+            continue
+        # 200 is an upload served from the result cache, already completed
+        if status not in (200, 202):
+            time.sleep(poll_interval)
+            continue
+
+        job_id = json.loads(data)['job_id']
+        job_start = time.perf_counter()
+        job_status = 'completed' if status == 200 else wait_for_job(base_url, job_id, poll_interval, job_timeout,
+                                                                    recorder)
+        recorder.job_finished(job_status, sum(pages for _, _, pages in batch), time.perf_counter() - job_start)
+        if job_status == 'completed':
+            status, data, _ = recorder.request('download_all', f'{base_url}/download_all/{job_id}')
+            if status == 200:
+                recorder.downloaded(len(data))
+
+
+def run_probe(base_url, stop, interval, recorder):
+    while not stop.is_set():
+        recorder.request('health', f'{base_url}/health')
+        stop.wait(interval)
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of the gunicorn master, its workers and their extraction processes"""
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.master = psutil.Process(master_pid)
+        self.interval = interval
+        self.samples = {}
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                processes = [self.master] + self.master.children(recursive=True)
+            except psutil.NoSuchProcess:
+                return
+            for process in processes:
+                try:
+                    rss = process.memory_info().rss
+                    parent = process.ppid()
+                except psutil.NoSuchProcess:
+                    continue
+                role = ('master' if process.pid == self.master.pid else
+                        'worker' if parent == self.master.pid else 'extraction')
+                self.samples.setdefault(process.pid, (role, []))[1].append(rss)
+            self.stop.wait(self.interval)
+
+    def summary(self):
+        return [{'pid': pid, 'role': role, 'peak_rss_mb': round(max(values) / (1024 * 1024), 1),
+                 'mean_rss_mb': round(sum(values) / len(values) / (1024 * 1024), 1), 'samples': len(values)}
+                for pid, (role, values) in sorted(self.samples.items())]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(run_dir, port, workers, threads, env):
+    """Start gunicorn serving the app from run_dir and wait until /health answers"""
+    with open(os.path.join(run_dir, 'server.log'), 'wb') as log:
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+                                   '--workers', str(workers), '--worker-class', 'gthread', '--threads', str(threads),
+                                   '--timeout', '120', '--pythonpath', WEB_APP_DIR, 'app:app'],
+                                  cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=2):
+                return server
+        except OSError:
+            time.sleep(0.25)
+    server.kill()
+    with open(os.path.join(run_dir, 'server.log'), errors='replace') as server_log:
+        sys.exit(f"gunicorn did not start:\n{server_log.read()[-4000:]}")
+
+
+def summarize_endpoint(samples, elapsed):
+    latencies = [latency for latency, _ in samples]
+    errors = sum(1 for _, status in samples if status is None or (status >= 400 and status != 429))
+    rejected = sum(1 for _, status in samples if status == 429)
+    summary = {'count': len(samples), 'per_second': round(len(samples) / elapsed, 2), 'errors': errors,
+               'error_rate': round(errors / len(samples), 4) if samples else 0, 'rejected': rejected}
+    for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)):
+        value = percentile(latencies, q)
+        summary[f'{name}_ms'] = round(value * 1000, 1) if value is not None else None
+    return summary
+
+
+def print_report(results):
+    print(f"\n{results['config']['workers']} workers x {results['config']['threads']} threads, "
+          f"{results['config']['clients']} upload clients, {results['elapsed_seconds']:.0f}s")
+    print(f"{'endpoint':<14}{'count':>7}{'req/s':>8}{'errors':>8}{'429s':>6}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'max ms':>9}")
+    for endpoint, summary in results['endpoints'].items():
+        if not summary['count']:
+            continue
+        print(f"{endpoint:<14}{summary['count']:>7}{summary['per_second']:>8.2f}{summary['errors']:>8}"
+              f"{summary['rejected']:>6}{summary['p50_ms']:>9.1f}{summary['p95_ms']:>9.1f}"
+              f"{summary['p99_ms']:>9.1f}{summary['max_ms']:>9.1f}")
+    jobs = results['jobs']
+    print(f"\njobs: {jobs['completed']} completed, {jobs['failed']} failed, {jobs['timed_out']} timed out, "
+          f"{jobs['per_second']:.3f} jobs/s, "
+          f"{jobs['pages_per_second']:.2f} pages/s, p50 {jobs['p50_seconds']}s, p95 {jobs['p95_seconds']}s")
+    print(f"\n{'pid':>8}  {'role':<11}{'peak MB':>9}{'mean MB':>9}")
+    for process in results['processes']:
+        print(f"{process['pid']:>8}  {process['role']:<11}{process['peak_rss_mb']:>9.1f}{process['mean_rss_mb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes (default: 4)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker (default: 8)')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent upload clients (default: 4)')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to keep starting uploads (default: 60)')
+    parser.add_argument('--pdf', action='append', help='PDF to upload (default: bundled sample)')
+    parser.add_argument('--synthetic-pages', type=int, nargs='*', default=[20],
+                        help='page counts of synthetic PDFs added to the upload mix (default: 20)')
+    parser.add_argument('--red-density', type=float, default=0.3)
+    parser.add_argument('--files-per-upload', type=int, default=1)
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between /status polls')
+    parser.add_argument('--job-timeout', type=float, default=600,
+                        help='seconds to poll a job before counting it as timed out (default: 600)')
+    parser.add_argument('--probe-interval', type=float, default=0.2, help='seconds between /health probes')
+    parser.add_argument('--request-timeout', type=float, default=120)
+    parser.add_argument('--caches', action='store_true', help='keep the result and raster caches on')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra environment for the server, e.g. EXTRACTION_WORKERS=2')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    pdf_paths = [os.path.abspath(path) for path in args.pdf or [DEFAULT_PDF]]
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        import fitz
+        # Imports app through _env.import_app, with its storage in another scratch directory
+        from pipeline import make_synthetic_pdf
+
+        pdfs = []
+        for path in pdf_paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                pdfs.append((os.path.basename(path), data, doc.page_count))
+        for pages in args.synthetic_pages:
+            pdfs.append((f'synthetic-{pages}p.pdf', make_synthetic_pdf(pages, args.red_density), pages))
+
+        server_dir = os.path.join(run_dir, 'server')
+        os.makedirs(server_dir)
+        env = dict(os.environ, LOG_LEVEL='WARNING')
+        # Relative storage paths resolve against web_app/, so keep the server's state in the scratch directory
+        env.update(storage_env(server_dir))
+        # Set either way: importing pipeline turns both off in this process's environment
+        caches = 'true' if args.caches else 'false'
+        env.update(RESULT_CACHE_ENABLED=caches, RASTER_CACHE_ENABLED=caches)
+        overrides = dict(item.split('=', 1) for item in args.env)
+        env.update(overrides)
+
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        server = start_server(server_dir, port, args.workers, args.threads, env)
+        sampler = RssSampler(server.pid)
+        sampler.start()
+        recorder = Recorder(args.request_timeout)
+        stop_probe = threading.Event()
+        try:
+            start = time.perf_counter()
+            deadline = time.time() + args.duration
+            probe = threading.Thread(target=run_probe, args=(base_url, stop_probe, args.probe_interval, recorder))
+            probe.start()
+            clients = [threading.Thread(target=run_uploader,
+                                        args=(client, base_url, pdfs, args.files_per_upload, deadline,
+                                              args.poll_interval, args.job_timeout, recorder))
+                       for client in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+            stop_probe.set()
+            probe.join()
+        finally:
+            stop_probe.set()
+            sampler.stop.set()
+            server.send_signal(signal.SIGTERM)
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    job_seconds = recorder.jobs['seconds']
+    results = {
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {'workers': args.workers, 'threads': args.threads, 'clients': args.clients,
+                   'duration': args.duration, 'files_per_upload': args.files_per_upload, 'caches': args.caches,
+                   'env': overrides, 'pdfs': [{'name': name, 'pages': pages, 'bytes': len(data)}
+                                               for name, data, pages in pdfs]},
+        'elapsed_seconds': round(elapsed, 2),
+        'endpoints': {endpoint: summarize_endpoint(samples, elapsed)
+                      for endpoint, samples in recorder.samples.items()},
+        'jobs': {'completed': recorder.jobs['completed'], 'failed': recorder.jobs['failed'],
+                 'timed_out': recorder.jobs['timed_out'],
+                 'per_second': round(recorder.jobs['completed'] / elapsed, 4),
+                 'pages_per_second': round(recorder.jobs['pages'] / elapsed, 2),
+                 'p50_seconds': round(percentile(job_seconds, 50), 2) if job_seconds else None,
+                 'p95_seconds': round(percentile(job_seconds, 95), 2) if job_seconds else None,
+                 'download_bytes': recorder.download_bytes},
+        'processes': sampler.summary(),
+    }
+
+    print_report(results)
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Peak RSS of the red-content PDF path by page count, whole-document vs windowed
+
+Each run extracts a synthetic PDF in a fresh process, so the peaks of earlier
+runs don't leak into later ones. With windows the peak should stay roughly
+flat as the page count grows.
+
+Usage: python benchmarks/memory.py [--pages 20 80 200] [--window-pages 10] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from _env import import_app
+
+
+def run_extraction(pdf_path, output_path, window_pages):
+    """Child process: extract one PDF and print seconds and peak RSS as JSON"""
+    app = import_app()
+    app.app.config['EXTRACTION_WINDOW_PAGES'] = window_pages
+    start = time.perf_counter()
+    app.extract_red_pdf_contents(pdf_path, output_path=output_path)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'seconds': seconds, 'peak_rss_mb': round(peak / (1024 * 1024), 1)}))
+
+
+def measure(pdf_path, output_path, window_pages):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', pdf_path, output_path,
+                             str(window_pages)], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        run_extraction(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[20, 80, 200])
+    parser.add_argument('--window-pages', type=int, default=10)
+    parser.add_argument('--red-density', type=float, default=0.5)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    from pipeline import make_synthetic_pdf
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, 'red_content.pdf')
+        for pages in args.pages:
+            pdf_path = os.path.join(tmp_dir, f'synthetic-{pages}p.pdf')
+            with open(pdf_path, 'wb') as f:
+                f.write(make_synthetic_pdf(pages, args.red_density))
+            for window_pages in (0, args.window_pages):
+                result = measure(pdf_path, output_path, window_pages)
+                result.update({'pages': pages, 'window_pages': window_pages,
+                               'bytes': os.path.getsize(output_path)})
+                results.append(result)
+
+    print(f"{'pages':>6}{'window':>8}{'seconds':>10}{'peak MB':>10}{'size (KB)':>12}")
+    for result in results:
+        window = result['window_pages'] or 'none'
+        print(f"{result['pages']:>6}{window:>8}{result['seconds']:>10.2f}{result['peak_rss_mb']:>10.1f}"
+              f"{result['bytes'] / 1024:>12.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'red_density': args.red_density, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Compare extraction time and output size of the raster, vector, DOCX image and DOCX text outputs
+
+The raster PDF and DOCX image outputs are also run with IMAGE_ENCODING 'png'
+(full RGB PNG regions) for comparison with the configured encoding.
+
+Usage: python benchmarks/output_modes.py [pdf] [--docx-dpi 380 200 150] [--json out.json]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+from _env import import_app
+from image_encoding import RegionEncoder
+
+app = import_app()
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '1-mvr-part-4-jul24_436.pdf')
+
+
+@contextlib.contextmanager
+def render_dpi(dpi):
+    """Temporarily render every block type at the given DPI"""
+    saved = dict(app.RENDER_DPI)
+    app.RENDER_DPI.update({kind: dpi for kind in saved})
+    try:
+        yield
+    finally:
+        app.RENDER_DPI.update(saved)
+
+
+@contextlib.contextmanager
+def image_encoding(encoding):
+    """Temporarily encode rendered regions with the given IMAGE_ENCODING"""
+    saved = app.region_encoder
+    app.region_encoder = RegionEncoder(encoding, saved.palette_colors, saved.table_format, saved.jpeg_quality,
+                                       saved.threads)
+    try:
+        yield
+    finally:
+        app.region_encoder = saved
+
+
+def run_pdf_mode(pdf_data, mode):
+    start = time.perf_counter()
+    output = app.extract_red_pdf_contents(pdf_data, output_mode=mode)
+    return time.perf_counter() - start, len(output)
+
+
+def run_docx(pdf_data, dpi, docx_mode='image'):
+    with render_dpi(dpi), tempfile.TemporaryDirectory() as tmp_dir:
+        docx_path = os.path.join(tmp_dir, 'output.docx')
+        start = time.perf_counter()
+        images = app.extract_red_images(pdf_data, docx_mode=docx_mode)
+        app.create_word_document_with_positioned_images(images, docx_path)
+        return time.perf_counter() - start, os.path.getsize(docx_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pdf', nargs='?', default=DEFAULT_PDF)
+    parser.add_argument('--docx-dpi', type=int, nargs='+', default=[380, 200, 150])
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    with open(args.pdf, 'rb') as f:
+        pdf_data = f.read()
+
+    results = []
+    for mode in app.OUTPUT_MODES:
+        seconds, size = run_pdf_mode(pdf_data, mode)
+        results.append({'output': f'pdf-{mode}', 'seconds': seconds, 'bytes': size})
+    for dpi in args.docx_dpi:
+        seconds, size = run_docx(pdf_data, dpi)
+        results.append({'output': f'docx-{dpi}dpi', 'seconds': seconds, 'bytes': size})
+    # Text and headings as Word runs, tables still rendered at the first DPI
+    seconds, size = run_docx(pdf_data, args.docx_dpi[0], docx_mode='text')
+    results.append({'output': 'docx-text', 'seconds': seconds, 'bytes': size})
+    if app.region_encoder.encoding != 'png':
+        with image_encoding('png'):
+            seconds, size = run_pdf_mode(pdf_data, 'raster')
+            results.append({'output': 'pdf-raster-png', 'seconds': seconds, 'bytes': size})
+            seconds, size = run_docx(pdf_data, args.docx_dpi[0])
+            results.append({'output': f'docx-{args.docx_dpi[0]}dpi-png', 'seconds': seconds, 'bytes': size})
+
+    print(f"{'output':<18}{'seconds':>10}{'size (KB)':>12}")
+    for result in results:
+        print(f"{result['output']:<18}{result['seconds']:>10.2f}{result['bytes'] / 1024:>12.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'pdf': os.path.basename(args.pdf), 'image_encoding': app.region_encoder.settings(),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Benchmark the extraction pipeline stage by stage
+
+Runs extract_red_pdf_contents, extract_images_with_positions,
+create_word_document_with_positioned_images and the direct extract_red_images
+path against the bundled sample PDF and synthetic PDFs, and reports wall time,
+pages/sec, peak RSS and output size per stage.
+
+Usage:
+    python benchmarks/pipeline.py --json results.json
+    python benchmarks/pipeline.py --json new.json --compare results.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+
+import fitz
+import psutil
+
+from _env import import_app
+
+app = import_app()
+
+DEFAULT_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '1-mvr-part-4-jul24_436.pdf')
+
+STAGES = ('extract_pdf', 'extract_images', 'build_docx', 'extract_direct')
+
+RED = (218 / 255, 31 / 255, 51 / 255)
+
+WORDS = ("machinery systems are to be designed constructed and installed in accordance with the "
+         "requirements of this part plans particulars submitted for review shafting propulsion "
+         "steering vessel classed surveyor approval").split()
+
+
+class RssSampler:
+    """Track the peak resident set size of this process while a stage runs"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def make_synthetic_pdf(pages, red_density, blocks_per_page=12, seed=0):
+    """Build a PDF of distinct text paragraphs where red_density of them are red"""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        y = 60
+        for _ in range(blocks_per_page):
+            color = RED if rng.random() < red_density else (0, 0, 0)
+            rect = fitz.Rect(60, y, page.rect.width - 60, y + 48)
+            text = ' '.join(rng.choice(WORDS) for _ in range(40)).capitalize() + '.'
+            page.insert_textbox(rect, text, fontsize=10, fontname='tiro', color=color)
+            y += 56
+    data = doc.tobytes(garbage=4, deflate=True)
+    doc.close()
+    return data
+
+
+def timed(fn, repeat):
+    """Run fn repeat times; return the median seconds, max peak RSS and last result"""
+    times = []
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        peak = max(peak, sampler.peak)
+    return statistics.median(times), peak, result
+
+
+def bench_case(name, pdf_data, repeat):
+    with fitz.open(stream=pdf_data, filetype='pdf') as doc:
+        pages = doc.page_count
+
+    stages = {}
+
+    def record(stage, seconds, peak, output_bytes):
+        stages[stage] = {
+            'seconds': round(seconds, 4),
+            'pages_per_sec': round(pages / seconds, 2) if seconds else None,
+            'peak_rss_mb': round(peak / (1024 * 1024), 1),
+            'output_bytes': output_bytes
+        }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        docx_path = os.path.join(tmp_dir, 'output.docx')
+
+        seconds, peak, processed_pdf = timed(lambda: app.extract_red_pdf_contents(pdf_data), repeat)
+        record('extract_pdf', seconds, peak, len(processed_pdf))
+
+        seconds, peak, images = timed(lambda: app.extract_images_with_positions(processed_pdf), repeat)
+        record('extract_images', seconds, peak, sum(len(image['image_bytes']) for image in images))
+
+        seconds, peak, _ = timed(lambda: app.create_word_document_with_positioned_images(images, docx_path), repeat)
+        record('build_docx', seconds, peak, os.path.getsize(docx_path))
+
+        seconds, peak, images = timed(lambda: app.extract_red_images(pdf_data), repeat)
+        record('extract_direct', seconds, peak, sum(len(image['image_bytes']) for image in images))
+
+    return {'name': name, 'pages': pages, 'input_bytes': len(pdf_data), 'stages': stages}
+
+
+def compare(results, baseline, threshold):
+    """Return a list of stage regressions slower than baseline by more than threshold"""
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old_case = baseline_cases.get(case['name'])
+        if old_case is None:
+            continue
+        for stage, new in case['stages'].items():
+            old = old_case['stages'].get(stage)
+            if old is None or not old['seconds']:
+                continue
+            change = new['seconds'] / old['seconds'] - 1
+            if change > threshold:
+                regressions.append(f"{case['name']} {stage}: {old['seconds']:.3f}s -> "
+                                   f"{new['seconds']:.3f}s (+{change:.0%})")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'case':<28}{'stage':<16}{'seconds':>9}{'pages/s':>9}{'peak MB':>9}{'output KB':>11}")
+    for case in results['cases']:
+        for stage in STAGES:
+            row = case['stages'][stage]
+            print(f"{case['name']:<28}{stage:<16}{row['seconds']:>9.3f}{row['pages_per_sec'] or 0:>9.1f}"
+                  f"{row['peak_rss_mb']:>9.1f}{row['output_bytes'] / 1024:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the red-text extraction pipeline')
+    parser.add_argument('--pdf', action='append', help='PDF to benchmark (default: bundled sample)')
+    parser.add_argument('--synthetic-pages', type=int, nargs='*', default=[10, 50])
+    parser.add_argument('--red-density', type=float, nargs='*', default=[0.1, 0.5])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage; the median time is reported')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown per stage before --compare fails (default: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    cases = []
+    for path in args.pdf or [DEFAULT_PDF]:
+        with open(path, 'rb') as f:
+            cases.append((os.path.basename(path), f.read()))
+    for pages in args.synthetic_pages:
+        for density in args.red_density:
+            cases.append((f"synthetic-{pages}p-{density:g}red", make_synthetic_pdf(pages, density)))
+
+    results = {
+        'created': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'settings': app.extraction_settings(),
+        'cases': []
+    }
+    for name, pdf_data in cases:
+        results['cases'].append(bench_case(name, pdf_data, args.repeat))
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo stage regressed beyond {args.threshold:.0%}")
+
+
+if __name__ == '__main__':
+    main()
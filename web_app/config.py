@@ -1,10 +1,16 @@
 # Production Configuration
 import os
 
+# Relative storage paths resolve against the app's directory, not the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _app_path(path):
+    return path if path is None else os.path.join(BASE_DIR, path)
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
-    OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER') or 'output'
+    UPLOAD_FOLDER = _app_path(os.environ.get('UPLOAD_FOLDER') or 'uploads')
+    OUTPUT_FOLDER = _app_path(os.environ.get('OUTPUT_FOLDER') or 'output')
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # 100MB
     
     # File cleanup settings
@@ -14,6 +20,42 @@ class Config:
     # Processing settings
     MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', 5))
     PROCESSING_TIMEOUT = int(os.environ.get('PROCESSING_TIMEOUT', 300))  # 5 minutes
+    QUEUE_TIMEOUT = int(os.environ.get('QUEUE_TIMEOUT', 3600))  # Queued jobs not started by then fail
+    MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 4))  # Open /events streams per worker process; clients over it poll /status
+    ADMISSION_BUDGET = float(os.environ.get('ADMISSION_BUDGET', 1000))  # Page-equivalents queued or processing at once; 0 disables
+    ADMISSION_COST_PER_MB = float(os.environ.get('ADMISSION_COST_PER_MB', 2))  # Page-equivalents added per MB of PDF
+    ADMISSION_COST_PER_SECOND = float(os.environ.get('ADMISSION_COST_PER_SECOND', 2))  # Drain rate used for Retry-After
+    JOB_DB_PATH = _app_path(os.environ.get('JOB_DB_PATH') or 'jobs.sqlite3')
+    
+    # Monitoring settings
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    METRICS_DB_PATH = _app_path(os.environ.get('METRICS_DB_PATH') or 'metrics.sqlite3')
+    
+    # Extraction settings
+    EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', 1))  # >1 enables page-parallel extraction
+    TEXT_DPI = int(os.environ.get('TEXT_DPI', 380))  # Red text blocks
+    HEADING_DPI = int(os.environ.get('HEADING_DPI', 380))  # Bold section headings
+    TABLE_DPI = int(os.environ.get('TABLE_DPI', 380))  # Tables containing red text
+    PDF_OUTPUT_MODE = os.environ.get('PDF_OUTPUT_MODE') or 'raster'  # 'raster' or 'vector'
+    DOCX_OUTPUT_MODE = os.environ.get('DOCX_OUTPUT_MODE') or 'image'  # 'image' or 'text'
+    EXTRACTION_WINDOW_PAGES = int(os.environ.get('EXTRACTION_WINDOW_PAGES', 0))  # Pages per window; 0 processes the whole PDF at once
+    EXTRACTION_MAX_RSS_MB = int(os.environ.get('EXTRACTION_MAX_RSS_MB', 0))  # Ends a page window early above this RSS; 0 disables
+    REGION_MERGE_GAP = float(os.environ.get('REGION_MERGE_GAP', 2))  # Points; negative disables merging
+    SPAN_RULES_FILE = os.environ.get('SPAN_RULES_FILE')  # JSON overrides of span_rules.DEFAULT_SPAN_RULES
+    IMAGE_ENCODING = os.environ.get('IMAGE_ENCODING') or 'compact'  # 'compact' or 'png' (full RGB PNG)
+    IMAGE_PALETTE_COLORS = int(os.environ.get('IMAGE_PALETTE_COLORS', 64))  # Colors kept in regions with more than 256; 0 keeps RGB
+    TABLE_IMAGE_FORMAT = os.environ.get('TABLE_IMAGE_FORMAT') or 'png'  # 'png' or 'jpeg' for compact table images
+    TABLE_JPEG_QUALITY = int(os.environ.get('TABLE_JPEG_QUALITY', 85))
+    IMAGE_ENCODE_THREADS = int(os.environ.get('IMAGE_ENCODE_THREADS', 4))  # Regions of a page encoded at once
+    
+    # Result cache settings
+    RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_FOLDER = _app_path(os.environ.get('RESULT_CACHE_FOLDER') or 'cache')
+    RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
+    RASTER_CACHE_ENABLED = os.environ.get('RASTER_CACHE_ENABLED', 'true').lower() == 'true'
+    RASTER_CACHE_MAX_BYTES = int(os.environ.get('RASTER_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 64MB per process
+    RASTER_CACHE_FOLDER = _app_path(os.environ.get('RASTER_CACHE_FOLDER', 'cache/raster') or None)  # Disk tier shared by jobs; empty disables reuse between jobs
+    RASTER_CACHE_DISK_MAX_BYTES = int(os.environ.get('RASTER_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))  # 1GB
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,126 @@
+# Fingerprinting of red regions and comparison of two rule editions
+import json
+import hashlib
+from collections import Counter, defaultdict
+
+# Statuses of regions in the new edition that go into the delta output
+DELTA_STATUSES = ('changed', 'added')
+
+
+def normalize_text(text):
+    return ' '.join(text.split())
+
+
+def fingerprint_regions(page_results):
+    """Region records with section anchors and fingerprints, in reading order
+
+    page_results are located pages from the extraction pipeline, in page order.
+    Each region is anchored to the last numbered section heading at or above
+    its top edge, possibly on an earlier page. The fingerprint covers the
+    region kind, section and the normalized text and fonts of its content
+    spans, but not its coordinates, so content that only moved on the page
+    keeps its fingerprint.
+    """
+    regions = []
+    section = None
+    for result in page_results:
+        headings = sorted(result['headings'], key=lambda heading: heading[0][1])
+        next_heading = 0
+        for index, ((rect, kind, _), spans) in enumerate(zip(result['placements'], result['region_spans'])):
+            while next_heading < len(headings) and headings[next_heading][0][1] <= rect.y0:
+                section = headings[next_heading][1]
+                next_heading += 1
+
+            text = normalize_text(' '.join(span_text for span_text, _, _ in spans))
+            fonts = sorted({(font, size) for _, font, size in spans})
+            fingerprint = hashlib.sha1(json.dumps([kind, section, text, fonts]).encode('utf-8')).hexdigest()
+
+            regions.append({
+                'page': result['page_num'],
+                'index': index,
+                'kind': kind,
+                'bbox': [round(value, 2) for value in rect],
+                'section': section,
+                'text': text,
+                'has_red': bool(spans) or kind == 'table',
+                'fingerprint': fingerprint
+            })
+        if next_heading < len(headings):
+            section = headings[-1][1]
+    return regions
+
+
+def _report_entry(region):
+    entry = {key: region[key] for key in ('kind', 'bbox', 'section', 'text')}
+    entry['page'] = region['page'] + 1
+    return entry
+
+
+def diff_regions(regions, reference_regions):
+    """Compare fingerprinted regions of a new edition against a reference edition
+
+    Sets region['status'] on every new-edition region: red regions are
+    'unchanged' when the reference has the same fingerprint, 'changed' when
+    the reference has an unmatched region of the same kind in the same section,
+    and 'added' otherwise. Regions without red content are 'context', and
+    those anchoring a section with changes are kept in the delta. Returns the
+    change report.
+    """
+    red_regions = [region for region in regions if region['has_red']]
+    reference_red = [region for region in reference_regions if region['has_red']]
+
+    # Exact matches first, so a moved block isn't paired with its neighbour
+    available = Counter(region['fingerprint'] for region in reference_red)
+    unmatched = []
+    for region in red_regions:
+        if available[region['fingerprint']]:
+            available[region['fingerprint']] -= 1
+            region['status'] = 'unchanged'
+        else:
+            unmatched.append(region)
+
+    remaining = defaultdict(list)
+    for region in reference_red:
+        if available[region['fingerprint']]:
+            available[region['fingerprint']] -= 1
+            remaining[(region['section'], region['kind'])].append(region)
+
+    changes = []
+    for region in unmatched:
+        candidates = remaining[(region['section'], region['kind'])]
+        entry = _report_entry(region)
+        if candidates:
+            region['status'] = 'changed'
+            entry['reference'] = _report_entry(candidates.pop(0))
+        else:
+            region['status'] = 'added'
+        entry['status'] = region['status']
+        changes.append(entry)
+
+    for candidates in remaining.values():
+        for region in candidates:
+            entry = _report_entry(region)
+            entry['status'] = 'removed'
+            changes.append(entry)
+
+    changed_sections = {region['section'] for region in unmatched}
+    for region in regions:
+        if not region['has_red']:
+            region['status'] = 'context'
+            region['in_delta'] = region['section'] in changed_sections
+        else:
+            region['in_delta'] = region['status'] in DELTA_STATUSES
+
+    statuses = Counter(change['status'] for change in changes)
+    return {
+        'summary': {
+            'regions': len(red_regions),
+            'reference_regions': len(reference_red),
+            'unchanged': len(red_regions) - len(unmatched),
+            'changed': statuses['changed'],
+            'added': statuses['added'],
+            'removed': statuses['removed'],
+            'pages_with_changes': len({region['page'] for region in unmatched})
+        },
+        'changes': changes
+    }
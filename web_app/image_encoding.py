@@ -0,0 +1,93 @@
+# Compact encoding of rendered regions for the Word document and red-content PDF
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+IMAGE_ENCODINGS = ('png', 'compact')
+TABLE_IMAGE_FORMATS = ('png', 'jpeg')
+
+
+def raw_size(data):
+    """Size in bytes of the RGB pixmap an encoded image was made from, read from its header"""
+    width, height = Image.open(io.BytesIO(data)).size
+    return width * height * 3
+
+
+def _save(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+class RegionEncoder:
+    """Encodes rendered RGB regions as PNG or JPEG bytes
+
+    'png' writes every region as the full RGB PNG MuPDF produces. 'compact'
+    picks the smallest faithful form per region: grayscale when it has no
+    color and an exact palette when it has at most 256 colors, both lossless;
+    otherwise red and black text is reduced to a palette of palette_colors
+    colors. Tables get the same treatment, or JPEG at jpeg_quality when
+    table_format is 'jpeg'. Compact regions are encoded on a thread pool, as
+    Pillow releases the GIL while compressing.
+    """
+
+    def __init__(self, encoding='compact', palette_colors=64, table_format='png', jpeg_quality=85, threads=4):
+        if encoding not in IMAGE_ENCODINGS:
+            raise ValueError(f"Unknown image encoding: {encoding}")
+        if table_format not in TABLE_IMAGE_FORMATS:
+            raise ValueError(f"Unknown table image format: {table_format}")
+        self.encoding = encoding
+        self.palette_colors = palette_colors
+        self.table_format = table_format
+        self.jpeg_quality = jpeg_quality
+        self.threads = threads
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def settings(self):
+        """Settings that change the encoded bytes, for cache keys"""
+        if self.encoding == 'png':
+            return {'encoding': 'png'}
+        return {'encoding': self.encoding, 'palette_colors': self.palette_colors,
+                'table_format': self.table_format, 'jpeg_quality': self.jpeg_quality}
+
+    def _executor(self):
+        # Threads don't survive fork, so each extraction worker process starts its own pool
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='region-encoder')
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _compact(self, image, kind):
+        if kind == 'table' and self.table_format == 'jpeg':
+            return _save(image, 'JPEG', quality=self.jpeg_quality)
+        colors = image.getcolors(256)
+        if colors is not None and all(r == g == b for _, (r, g, b) in colors):
+            return _save(image.convert('L'), 'PNG')
+        if colors is not None:
+            palette_image = image.quantize(colors=len(colors), method=Image.Quantize.MEDIANCUT,
+                                           dither=Image.Dither.NONE)
+            palette = palette_image.getpalette()[:3 * len(colors)]
+            # Median cut keeps every color when asked for as many as there are; otherwise stay lossless as RGB
+            if set(zip(palette[0::3], palette[1::3], palette[2::3])) == {color for _, color in colors}:
+                return _save(palette_image, 'PNG')
+            return _save(image, 'PNG')
+        if self.palette_colors:
+            image = image.quantize(colors=self.palette_colors, method=Image.Quantize.FASTOCTREE,
+                                   dither=Image.Dither.NONE)
+        return _save(image, 'PNG')
+
+    def encode_all(self, regions):
+        """Encoded bytes of each (pixmap, kind) in regions, in order"""
+        if self.encoding == 'png':
+            return [pix.tobytes("png") for pix, _ in regions]
+        # Pixmaps are copied out on this thread; only Pillow work runs on the pool
+        images = [(Image.frombytes('RGB', (pix.width, pix.height), pix.samples), kind) for pix, kind in regions]
+        if len(images) == 1:
+            return [self._compact(*images[0])]
+        return list(self._executor().map(lambda item: self._compact(*item), images))
@@ -0,0 +1,141 @@
+# Pipeline instrumentation: stage latency histograms, counters and structured logs
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import closing, contextmanager
+
+# Pipeline stages timed per document
+STAGES = ('pdf_open', 'span_classification', 'table_detection', 'rasterization', 'docx_build', 'save')
+
+# Histogram bucket upper bounds in seconds
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+COUNTERS = {
+    'app_pages_processed_total': 'PDF pages run through red-text extraction',
+    'app_red_blocks_found_total': 'Red text blocks found',
+    'app_raster_bytes_total': 'Uncompressed raster bytes rendered from PDF regions',
+    'app_page_windows_total': 'Page window boundaries where extraction released its caches and flushed output',
+    'app_raster_cache_memory_hits_total': 'Rendered regions served from the in-process raster cache',
+    'app_raster_cache_disk_hits_total': 'Rendered regions served from the shared on-disk raster cache',
+    'app_raster_cache_misses_total': 'Raster cache lookups that required rendering the region',
+    'app_image_bytes_encoded_total': 'Bytes of encoded images written for freshly rendered regions',
+    'app_image_bytes_saved_total': 'Raw RGB raster bytes minus encoded image bytes for freshly rendered regions',
+    'app_uploads_rejected_total': 'Uploads refused with 429 because the admission budget was full',
+}
+
+
+class PipelineMetrics:
+    """Stage latency histograms and counters, aggregated across worker processes
+
+    Observations accumulate in memory and flush() adds them to a SQLite table,
+    so /metrics reports totals from every gunicorn worker, not just the one
+    answering the scrape.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS metrics ('
+                         'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+                         'PRIMARY KEY (name, labels))')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def observe(self, stage, seconds):
+        """Record one duration of a pipeline stage"""
+        with self._lock:
+            for bound in STAGE_BUCKETS:
+                if seconds <= bound:
+                    self._pending[('app_stage_duration_seconds_bucket', f'stage="{stage}",le="{bound}"')] += 1
+            self._pending[('app_stage_duration_seconds_bucket', f'stage="{stage}",le="+Inf"')] += 1
+            self._pending[('app_stage_duration_seconds_sum', f'stage="{stage}"')] += seconds
+            self._pending[('app_stage_duration_seconds_count', f'stage="{stage}"')] += 1
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._pending[(name, '')] += value
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def flush(self):
+        """Add this process's pending observations to the shared totals"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        if not pending:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                             'ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value',
+                             [(name, labels, value) for (name, labels), value in pending.items()])
+            conn.execute('COMMIT')
+
+    def counters(self):
+        """Totals of the named counters across all worker processes"""
+        self.flush()
+        with closing(self._connect()) as conn:
+            values = dict(conn.execute("SELECT name, value FROM metrics WHERE labels = ''"))
+        return {name: int(values.get(name, 0)) for name in COUNTERS}
+
+    def render(self):
+        """Prometheus text exposition of all histograms and counters"""
+        self.flush()
+        with closing(self._connect()) as conn:
+            values = {(name, labels): value
+                      for name, labels, value in conn.execute('SELECT name, labels, value FROM metrics')}
+
+        lines = ['# HELP app_stage_duration_seconds Time spent in each pipeline stage per document',
+                 '# TYPE app_stage_duration_seconds histogram']
+        for stage in STAGES:
+            for bound in STAGE_BUCKETS + ('+Inf',):
+                labels = f'stage="{stage}",le="{bound}"'
+                lines.append(f'app_stage_duration_seconds_bucket{{{labels}}} '
+                             f'{int(values.get(("app_stage_duration_seconds_bucket", labels), 0))}')
+            labels = f'stage="{stage}"'
+            lines.append(f'app_stage_duration_seconds_sum{{{labels}}} '
+                         f'{values.get(("app_stage_duration_seconds_sum", labels), 0):.6f}')
+            lines.append(f'app_stage_duration_seconds_count{{{labels}}} '
+                         f'{int(values.get(("app_stage_duration_seconds_count", labels), 0))}')
+
+        for name, help_text in COUNTERS.items():
+            lines.extend(['', f'# HELP {name} {help_text}', f'# TYPE {name} counter',
+                          f'{name} {int(values.get((name, ""), 0))}'])
+        return '\n'.join(lines) + '\n'
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed via extra="""
+
+    _RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self._RESERVED})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level):
+    """Send structured logs to stderr unless logging is already configured"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter())
+    logging.basicConfig(level=level, handlers=[handler])
@@ -0,0 +1,471 @@
+# Background processing of upload jobs
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+# Seconds past its timeout before a job still marked processing is considered to have lost its worker
+INTERRUPTED_GRACE = 60
+
+
+class JobTimeoutError(Exception):
+    """Raised inside a job when it runs longer than the processing timeout"""
+
+
+class JobStore:
+    """Job state and output file index shared by all worker processes through SQLite
+
+    /status can be served by any gunicorn worker, so queue position, progress and
+    results are kept in the database rather than in the process running the job.
+    Every output file is indexed with its job, input hash, size and creation time
+    so lookups never have to scan the output folder. Progress changes are also
+    appended to an event log that /events streams to clients. Each job carries
+    an estimated cost, so admission can be decided against the work in flight
+    on all workers. Queued jobs keep their payload in the database, so any
+    worker can claim them and they survive a restart; a job still queued
+    after queue_timeout seconds is failed instead of run.
+    """
+
+    def __init__(self, db_path, timeout, queue_timeout=3600):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                         'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, '
+                         'started_at REAL, finished_at REAL, error TEXT, files TEXT NOT NULL, '
+                         'cost REAL NOT NULL DEFAULT 0)')
+            # Databases created before job costs were tracked or payloads were stored
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+            for column, definition in (('cost', 'REAL NOT NULL DEFAULT 0'), ('payload', 'TEXT')):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS outputs ('
+                         'filename TEXT PRIMARY KEY, job_id TEXT NOT NULL, original_name TEXT, '
+                         'input_sha256 TEXT, size INTEGER NOT NULL, created_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS outputs_job ON outputs (job_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS outputs_created ON outputs (created_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS maintenance (name TEXT PRIMARY KEY, last_run REAL NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS events ('
+                         'event_id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, '
+                         'type TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS events_job ON events (job_id, event_id)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def _add_event(conn, job_id, event_type, data):
+        conn.execute('INSERT INTO events (job_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+                     (job_id, event_type, json.dumps(data), time.time()))
+
+    def _in_flight_cost(self, conn):
+        # Jobs queued past the queue timeout won't run, those processing past the timeout lost their worker
+        now = time.time()
+        return conn.execute('SELECT COALESCE(SUM(cost), 0) FROM jobs WHERE (status = ? AND created_at > ?) '
+                            'OR (status = ? AND started_at > ?)',
+                            ('queued', now - self.queue_timeout, 'processing', now - self.timeout)).fetchone()[0]
+
+    def in_flight_cost(self):
+        """Estimated cost of the jobs queued or processing across all workers"""
+        with closing(self._connect()) as conn:
+            return self._in_flight_cost(conn)
+
+    def create(self, job_id, files, cost=0, budget=None, payload=None):
+        """Insert a queued job with its JSON payload; returns False without inserting it if it doesn't fit the budget
+
+        With a budget the job is only admitted while the in-flight cost plus
+        its own stays within it. When nothing is in flight a job is always
+        admitted, so one costing more than the whole budget still runs.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if budget:
+                in_flight = self._in_flight_cost(conn)
+                if in_flight > 0 and in_flight + cost > budget:
+                    conn.execute('ROLLBACK')
+                    return False
+            conn.execute('INSERT INTO jobs (job_id, status, created_at, files, cost, payload) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (job_id, 'queued', time.time(), json.dumps(files), cost,
+                          None if payload is None else json.dumps(payload)))
+            conn.execute('COMMIT')
+            return True
+
+    def _fail_stale(self, conn, now):
+        # Fail jobs queued past the queue timeout, and those processing whose worker is gone
+        stale = conn.execute('SELECT job_id, status FROM jobs WHERE (status = ? AND created_at < ?) '
+                             'OR (status = ? AND started_at < ?)',
+                             ('queued', now - self.queue_timeout,
+                              'processing', now - self.timeout - INTERRUPTED_GRACE)).fetchall()
+        for job_id, status in stale:
+            error = (f'Job was not started within {self.queue_timeout} seconds' if status == 'queued'
+                     else 'Job was interrupted')
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE job_id = ?',
+                         ('failed', now, error, job_id))
+            self._add_event(conn, job_id, 'job_failed', {'error': error})
+
+    def add_completed(self, job_id, files):
+        """Insert a job that was served without running, already completed"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            conn.execute('INSERT INTO jobs (job_id, status, created_at, started_at, finished_at, files) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (job_id, 'completed', now, now, now, json.dumps(files)))
+            self._add_event(conn, job_id, 'job_completed', {})
+            conn.execute('COMMIT')
+
+    def claim(self, max_running):
+        """Mark the oldest queued job as processing if fewer than max_running jobs are running
+
+        Returns (job_id, files, payload, started_at), or None if no job can
+        start now. Stale jobs are failed first.
+        """
+        with closing(self._connect()) as conn:
+            # Most polls find nothing to do; don't take the write lock for them
+            if conn.execute('SELECT 1 FROM jobs WHERE status = ? LIMIT 1', ('queued',)).fetchone() is None:
+                return None
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            self._fail_stale(conn, now)
+            # Jobs past their timeout belong to a worker that died; they hold no slot
+            running = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ? AND started_at > ?',
+                                   ('processing', now - self.timeout)).fetchone()[0]
+            # Jobs queued before payloads were stored can't be run; they expire with the queue timeout
+            row = conn.execute('SELECT job_id, files, payload FROM jobs WHERE status = ? AND payload IS NOT NULL '
+                               'ORDER BY created_at LIMIT 1', ('queued',)).fetchone()
+            if running >= max_running or row is None:
+                conn.execute('COMMIT')
+                return None
+            job_id, files, payload = row
+            conn.execute('UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?', ('processing', now, job_id))
+            self._add_event(conn, job_id, 'job_started', {})
+            conn.execute('COMMIT')
+            return job_id, json.loads(files), json.loads(payload), now
+
+    def update_files(self, job_id, files, event_type=None, data=None):
+        """Save per-file progress, appending an event in the same transaction"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('UPDATE jobs SET files = ? WHERE job_id = ?', (json.dumps(files), job_id))
+            if event_type is not None:
+                self._add_event(conn, job_id, event_type, data or {})
+            conn.execute('COMMIT')
+
+    def finish(self, job_id, status, files, error=None):
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, files = ?, error = ? WHERE job_id = ?',
+                         (status, time.time(), json.dumps(files), error, job_id))
+            self._add_event(conn, job_id, f'job_{status}', {'error': error} if error else {})
+            conn.execute('COMMIT')
+
+    def interrupt(self, job_id, error):
+        """Fail a job if it is still processing, as when its job process died or was killed"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT files FROM jobs WHERE job_id = ? AND status = ?',
+                               (job_id, 'processing')).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return
+            files = json.loads(row[0])
+            for file_info in files:
+                if file_info['status'] != 'completed':
+                    file_info['status'] = 'failed'
+            conn.execute('UPDATE jobs SET status = ?, finished_at = ?, files = ?, error = ? WHERE job_id = ?',
+                         ('failed', time.time(), json.dumps(files), error, job_id))
+            self._add_event(conn, job_id, 'job_failed', {'error': error})
+            conn.execute('COMMIT')
+
+    def events(self, job_id, after_id=0):
+        """(event_id, type, data JSON) of a job's events after after_id, oldest first"""
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT event_id, type, data FROM events WHERE job_id = ? AND event_id > ? '
+                                'ORDER BY event_id', (job_id, after_id)).fetchall()
+
+    def last_event_id(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT MAX(event_id) FROM events WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] or 0
+
+    def count_by_status(self):
+        """Number of jobs per status, counting only live processing jobs"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs WHERE status != ? OR started_at > ? '
+                                'GROUP BY status', ('processing', time.time() - self.timeout)).fetchall()
+        return dict(rows)
+
+    def add_output(self, job_id, filename, size, original_name=None, input_sha256=None):
+        """Index an output file written for a job"""
+        with closing(self._connect()) as conn:
+            conn.execute('INSERT OR REPLACE INTO outputs '
+                         '(filename, job_id, original_name, input_sha256, size, created_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (filename, job_id, original_name, input_sha256, size, time.time()))
+
+    def outputs(self, job_id):
+        """Output file names of a job in the order they were written"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT filename FROM outputs WHERE job_id = ? ORDER BY created_at',
+                                (job_id,)).fetchall()
+        return [filename for filename, in rows]
+
+    def latest_output(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT filename FROM outputs ORDER BY created_at DESC LIMIT 1').fetchone()
+        return row[0] if row else None
+
+    def output_stats(self):
+        """Number and total size of indexed output files"""
+        with closing(self._connect()) as conn:
+            count, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outputs').fetchone()
+        return {'files': count, 'bytes': size}
+
+    def expire(self, cutoff):
+        """Drop outputs created and jobs finished before cutoff; returns expired file names"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            filenames = [filename for filename, in conn.execute(
+                'SELECT filename FROM outputs WHERE created_at < ?', (cutoff,))]
+            conn.execute('DELETE FROM outputs WHERE created_at < ?', (cutoff,))
+            conn.execute('DELETE FROM events WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at < ?)',
+                         (cutoff,))
+            conn.execute('DELETE FROM jobs WHERE finished_at < ?', (cutoff,))
+            conn.execute('COMMIT')
+        return filenames
+
+    def claim_maintenance(self, name, interval):
+        """True for the one process that should run a periodic task now"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT last_run FROM maintenance WHERE name = ?', (name,)).fetchone()
+            now = time.time()
+            if row and row[0] > now - interval:
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute('INSERT OR REPLACE INTO maintenance (name, last_run) VALUES (?, ?)', (name, now))
+            conn.execute('COMMIT')
+            return True
+
+    def get(self, job_id):
+        """Job state with queue position and elapsed time, or None if unknown"""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT status, created_at, started_at, finished_at, error, files '
+                               'FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            status, created_at, started_at, finished_at, error, files = row
+            queue_position = None
+            if status == 'queued':
+                queue_position = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?',
+                                              ('queued', created_at)).fetchone()[0] + 1
+
+        now = time.time()
+        # A job still processing well past its timeout lost its worker process
+        if status == 'processing' and now - started_at > self.timeout + INTERRUPTED_GRACE:
+            status = 'failed'
+            error = 'Job was interrupted'
+        elif status == 'queued' and now - created_at > self.queue_timeout:
+            status = 'failed'
+            error = f'Job was not started within {self.queue_timeout} seconds'
+
+        return {
+            'job_id': job_id,
+            'status': status,
+            'queue_position': queue_position,
+            'created_at': created_at,
+            'elapsed_seconds': round((finished_at or now) - (started_at or now), 2),
+            'queued_seconds': round((started_at or now) - created_at, 2),
+            'error': error,
+            'files': json.loads(files)
+        }
+
+
+class JobProgress:
+    """Per-file and per-page progress of a running job, written through to the store"""
+
+    def __init__(self, store, job_id, files, deadline):
+        self.store = store
+        self.job_id = job_id
+        self.files = files
+        self.deadline = deadline
+
+    def check_deadline(self):
+        if time.time() > self.deadline:
+            raise JobTimeoutError(f"Processing exceeded {self.store.timeout} seconds")
+
+    def start_file(self, index):
+        self.check_deadline()
+        self.files[index]['status'] = 'processing'
+        self.store.update_files(self.job_id, self.files, 'file_started',
+                                {'file': index, 'original_name': self.files[index]['original_name']})
+
+    def page_done(self, index, pages_done, pages_total, red_blocks=0):
+        self.files[index]['pages_done'] = pages_done
+        self.files[index]['pages_total'] = pages_total
+        self.store.update_files(self.job_id, self.files, 'page_done',
+                                {'file': index, 'pages_done': pages_done, 'pages_total': pages_total,
+                                 'red_blocks': red_blocks})
+        self.check_deadline()
+
+    def finish_file(self, index, **info):
+        self.files[index].update(info)
+        self.files[index]['status'] = 'completed'
+        # The file's outputs can be downloaded while the rest of the job runs
+        self.store.update_files(self.job_id, self.files, 'file_ready', dict(self.files[index], file=index))
+
+
+def run_job(store, handler, job_id, files, payload, deadline):
+    """Run a claimed job to completion and record its outcome; the target of a job process"""
+    progress = JobProgress(store, job_id, files, deadline)
+    try:
+        handler(job_id, payload, progress)
+        store.finish(job_id, 'completed', files)
+    except Exception as e:
+        logger.exception("Job failed", extra={'job_id': job_id})
+        for file_info in files:
+            if file_info['status'] != 'completed':
+                file_info['status'] = 'failed'
+        store.finish(job_id, 'failed', files, error=str(e))
+
+
+class JobQueue:
+    """Threads of this process claiming queued jobs from the store and running each in a child process
+
+    Any process sharing the store may claim a job, whichever process it was
+    submitted to, and a job only starts once fewer than max_jobs jobs are
+    processing across all of them. Each job runs in a process started from
+    mp_context, so extraction neither holds the GIL of the web worker that
+    claimed it nor shares PyMuPDF state with other jobs. A job is aborted
+    between pages once it has run longer than the store's timeout, and its
+    process is killed if it hasn't ended INTERRUPTED_GRACE seconds later.
+    The handler and payload must be picklable.
+    """
+
+    def __init__(self, store, handler, max_jobs, mp_context, poll_interval=1.0):
+        self.store = store
+        self.handler = handler
+        self.max_jobs = max_jobs
+        self.mp_context = mp_context
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, file_names, payload, cost=0, budget=None):
+        """Queue a job; payload is stored as JSON and passed to the handler along with its progress
+
+        Returns False, queueing nothing, when the store doesn't admit the job's
+        cost within budget (see JobStore.create).
+        """
+        files = [{'original_name': name, 'status': 'queued', 'pages_done': 0, 'pages_total': None}
+                 for name in file_names]
+        if not self.store.create(job_id, files, cost, budget, payload):
+            return False
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def start(self):
+        """Start claiming jobs, including any left queued by a previous run"""
+        with self._lock:
+            while len(self._threads) < self.max_jobs:
+                thread = threading.Thread(target=self._run, name=f"job-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            try:
+                claimed = self.store.claim(self.max_jobs)
+            except Exception:
+                logger.exception("Claiming a job failed")
+                claimed = None
+            if claimed is None:
+                if self._wakeup.wait(self.poll_interval):
+                    self._wakeup.clear()
+                continue
+            self._supervise(*claimed)
+
+    def _supervise(self, job_id, files, payload, started_at):
+        deadline = started_at + self.store.timeout
+        # Not daemonic, as page-parallel extraction starts processes of its own
+        process = self.mp_context.Process(target=run_job, name=f"job-{job_id}",
+                                          args=(self.store, self.handler, job_id, files, payload, deadline))
+        try:
+            process.start()
+            process.join(max(deadline - time.time(), 0) + INTERRUPTED_GRACE)
+            if process.is_alive():
+                logger.error("Job process killed past its timeout", extra={'job_id': job_id})
+                process.kill()
+                process.join()
+                self.store.interrupt(job_id, f"Processing exceeded {self.store.timeout} seconds")
+            elif process.exitcode != 0:
+                logger.error("Job process died", extra={'job_id': job_id, 'exitcode': process.exitcode})
+                self.store.interrupt(job_id, f"Job process exited with code {process.exitcode}")
+        except Exception as e:
+            logger.exception("Running a job process failed", extra={'job_id': job_id})
+            self.store.interrupt(job_id, str(e))
+        finally:
+            if process.exitcode is not None:
+                process.close()
+
+
+class OutputReaper:
+    """Background thread deleting job outputs older than max_age
+
+    Every process runs the thread, but the store's maintenance lease lets only
+    one of them do a sweep per interval. Files the index doesn't know about,
+    such as leftovers from a crashed job, are removed by modification time.
+    """
+
+    def __init__(self, store, folders, interval, max_age):
+        self.store = store
+        self.folders = folders
+        self.interval = interval
+        self.max_age = max_age
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='output-reaper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.store.claim_maintenance('reaper', self.interval):
+                    self.run_once()
+            except Exception:
+                logger.exception("Output cleanup failed")
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Delete expired files now; returns the number of files removed"""
+        cutoff = time.time() - self.max_age
+        removed = 0
+        output_folder = self.folders[0]
+        for filename in self.store.expire(cutoff):
+            try:
+                os.remove(os.path.join(output_folder, filename))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        for folder in self.folders:
+            for entry in os.scandir(folder):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+        if removed:
+            logger.info("Expired outputs removed", extra={'files': removed, 'max_age': self.max_age})
+        return removed
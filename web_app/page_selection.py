@@ -0,0 +1,108 @@
+# Resolve page ranges and outline section names to the pages of a PDF to extract
+import re
+
+_RANGE_PATTERN = re.compile(r'^(\d*)\s*(?:(-)\s*(\d*))?$')
+
+# Separates a section from the titles of its enclosing entries, as in "Chapter 2 > Section 3"
+SECTION_PATH_SEPARATOR = '>'
+
+
+def parse_page_ranges(spec, page_count):
+    """Zero-based page numbers of a 1-based page range spec such as "1-3, 7, 10-"
+
+    A range missing its start or end runs from the first or to the last page.
+    Raises ValueError for malformed ranges and pages past the end.
+    """
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        match = _RANGE_PATTERN.match(part)
+        if match is None or part == '-':
+            raise ValueError(f"Invalid page range: {part!r}")
+        first, dash, last = match.groups()
+        start = int(first) if first else 1
+        stop = (int(last) if last else page_count) if dash else start
+        if start < 1:
+            raise ValueError(f"Invalid page range: {part!r}")
+        # An open range starting past the end is out of range rather than descending
+        for page in (start, stop):
+            if page > page_count:
+                raise ValueError(f"Page {page} is out of range, the PDF has {page_count} pages")
+        if stop < start:
+            raise ValueError(f"Invalid page range: {part!r}")
+        pages.update(range(start - 1, stop))
+    return pages
+
+
+def _title_matches(title, name):
+    # "Section 3" matches "Section 3" and "Section 3: Gas Turbines" but not "Section 31"
+    title = ' '.join(title.split()).casefold()
+    name = ' '.join(name.split()).casefold()
+    return title == name or (title.startswith(name) and not title[len(name)].isalnum())
+
+
+def section_pages(toc, page_count, name):
+    """Zero-based page numbers of the outline sections titled name
+
+    toc is the list of doc.get_toc(). A section runs from the page of its
+    entry to the page before the next entry at the same or a higher level
+    (or the end of the document). name may be qualified by enclosing entries,
+    e.g. "Chapter 2 > Section 3", and matches a title equal to it or starting
+    with it followed by punctuation or a space. Every matching section is
+    included; raises ValueError if there is none.
+    """
+    path = [part.strip() for part in name.split(SECTION_PATH_SEPARATOR) if part.strip()]
+    if not path:
+        raise ValueError("Empty section name")
+    pages = set()
+    found = False
+    ancestors = []
+    for index, (level, title, page) in enumerate(entry[:3] for entry in toc):
+        del ancestors[level - 1:]
+        ancestors.append(title)
+        if not _title_matches(title, path[-1]) or not _path_matches(ancestors[:-1], path[:-1]):
+            continue
+        found = True
+        if page < 1:
+            # Entry without a destination in this document
+            continue
+        stop = page_count
+        for next_level, _, next_page in (entry[:3] for entry in toc[index + 1:]):
+            if next_level <= level and next_page >= 1:
+                stop = max(next_page - 1, page)
+                break
+        pages.update(range(page - 1, min(stop, page_count)))
+    if not found:
+        raise ValueError(f"No section matching {name!r} in the PDF outline")
+    return pages
+
+
+def _path_matches(ancestors, path):
+    # Every enclosing name matches an enclosing entry, outermost first
+    remaining = iter(ancestors)
+    return all(any(_title_matches(title, name) for title in remaining) for name in path)
+
+
+def select_pages(doc, pages=None, sections=()):
+    """Sorted zero-based page numbers selected by a page range spec and section names, or None for all
+
+    The selection is the union of both. Sections are resolved through the
+    outline of doc (doc.get_toc()); raises ValueError if it has none, or if a
+    range or section doesn't resolve.
+    """
+    if not pages and not sections:
+        return None
+    selected = set()
+    if pages:
+        selected |= parse_page_ranges(pages, doc.page_count)
+    if sections:
+        toc = doc.get_toc()
+        if not toc:
+            raise ValueError("The PDF has no outline to find sections in")
+        for name in sections:
+            selected |= section_pages(toc, doc.page_count, name)
+    if not selected:
+        raise ValueError("The page selection is empty")
+    return sorted(selected)
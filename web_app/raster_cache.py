@@ -0,0 +1,133 @@
+# Cache of rendered PDF regions keyed on page content, clip rectangle and resolution
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+import fitz
+
+# Tiers a cached image can come from, as reported by RasterCache.get
+TIERS = ('memory', 'disk')
+
+
+# An indirect reference; /Parent links are dropped so a digest never pulls in the page tree
+_REFERENCE = re.compile(r'(/Parent\s*)?\b(\d+) (\d+) R\b')
+
+
+def _page_resources(doc, page):
+    # (type, value) of the page's /Resources, inherited from the page tree if the page has none
+    xref = page.xref
+    while xref:
+        kind, value = doc.xref_get_key(xref, 'Resources')
+        if kind != 'null':
+            return kind, value
+        kind, value = doc.xref_get_key(xref, 'Parent')
+        xref = int(value.split()[0]) if kind == 'xref' else 0
+    return 'null', 'null'
+
+
+def _resolve_references(doc, source, digests):
+    # PDF object source with each indirect reference replaced by the digest of its object
+    def replace(match):
+        if match.group(1):
+            return ''
+        xref = int(match.group(2))
+        if not 0 < xref < doc.xref_length():
+            return 'null'
+        return f'<{_object_digest(doc, xref, digests)}>'
+    return _REFERENCE.sub(replace, source)
+
+
+def _object_digest(doc, xref, digests):
+    # Digest of an object's dictionary (names kept, references resolved recursively) and raw stream
+    if xref in digests:
+        return digests[xref]
+    digests[xref] = 'cycle'  # Stands in for the object while it's being resolved
+    digest = hashlib.sha256()
+    digest.update(_resolve_references(doc, doc.xref_object(xref, compressed=True), digests).encode('utf-8'))
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    digests[xref] = digest.hexdigest()
+    return digests[xref]
+
+
+def page_digest(doc, page):
+    """SHA-256 hex digest of what a page renders from, or None if it can't be cached
+
+    Covers the page size and rotation, its content stream and its resolved
+    /Resources dictionary: fonts, images, form XObjects and their own
+    resources, ExtGState, ColorSpace, Shading and Pattern entries, with the
+    resource names kept and every object number replaced by a digest of the
+    object's contents. An identical page in another file or edition has the
+    same digest. Pages with annotations or form fields are not cached, as
+    their appearance lives outside the content stream.
+    """
+    if page.first_annot is not None or page.first_widget is not None:
+        return None
+    digests = {}
+    digest = hashlib.sha256()
+    digest.update(repr((tuple(page.rect), page.rotation)).encode('utf-8'))
+    digest.update(page.read_contents())
+    for kind, value in (_page_resources(doc, page), doc.xref_get_key(page.xref, 'Group')):
+        if kind == 'xref':
+            value = f'<{_object_digest(doc, int(value.split()[0]), digests)}>'
+        elif kind in ('dict', 'array'):
+            value = _resolve_references(doc, value, digests)
+        digest.update(f'{kind}:{value}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class RasterCache:
+    """Encoded images of rendered page regions, in an in-process LRU and an optional shared disk tier
+
+    The memory tier holds up to max_bytes of images per process. disk is a
+    ResultCache shared by all worker processes; its hits are copied into the
+    memory tier.
+    """
+
+    def __init__(self, max_bytes, disk=None):
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(digest, rect, dpi, variant=''):
+        """Cache key for a page_digest, clip rectangle, render DPI and encoding variant"""
+        clip = ','.join(f'{value:.2f}' for value in rect)
+        return hashlib.sha256(f"{digest}:{clip}:{dpi}:{variant}:{fitz.VersionBind}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """(image bytes, tier) for a cached region, or (None, None) on a miss"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data, 'memory'
+        if self.disk is not None:
+            data = self.disk.read(key)
+            if data is not None:
+                self.put(key, data, disk=False)
+                return data, 'disk'
+        return None, None
+
+    def put(self, key, data, disk=True):
+        """Cache a region's image, in the disk tier too unless disk is False"""
+        if len(data) <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._size -= len(old)
+                self._entries[key] = data
+                self._size += len(data)
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        if disk and self.disk is not None:
+            self.disk.write(key, data)
+
+    def stats(self):
+        """Entries and bytes in this process's memory tier"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size}
@@ -0,0 +1,169 @@
+# Content-addressed cache of generated Word documents
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+from contextlib import closing
+
+
+class ResultCache:
+    """Disk-backed LRU cache of generated files, shared by all worker processes
+
+    Word documents are keyed on the SHA-256 of the uploaded PDF plus the
+    extraction settings; the raster cache keeps its shared tier of rendered
+    regions in a second instance. The index lives in SQLite so that lookups,
+    inserts and eviction from several gunicorn workers are serialized by the
+    database lock.
+    """
+
+    def __init__(self, folder, max_bytes, suffix='.docx'):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        os.makedirs(folder, exist_ok=True)
+        self.db_path = os.path.join(folder, 'index.sqlite3')
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters ('
+                         'name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            # Running total of entry sizes, so inserts don't sum the whole index
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) "
+                         "SELECT 'bytes', COALESCE(SUM(size), 0) FROM entries")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _entry_path(self, key):
+        return os.path.join(self.folder, f"{key}{self.suffix}")
+
+    @staticmethod
+    def _bump(conn, name, value=1):
+        conn.execute('INSERT INTO counters (name, value) VALUES (?, ?) '
+                     'ON CONFLICT(name) DO UPDATE SET value = value + ?', (name, value, value))
+
+    def _delete(self, conn, key, size):
+        conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._bump(conn, 'bytes', -size)
+
+    @staticmethod
+    def make_key(pdf_hash, settings):
+        """Cache key for a PDF's SHA-256 hex digest and the settings used to process it"""
+        settings_json = json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(f"{pdf_hash}:{settings_json}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, key, use_entry):
+        """Return use_entry(entry_path) for a cached entry, or None on a miss"""
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                entry_path = self._entry_path(key)
+                if row and os.path.exists(entry_path):
+                    # Use the entry while holding the lock so a concurrent eviction cannot remove it
+                    result = use_entry(entry_path)
+                    conn.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+                    self._bump(conn, 'hits')
+                    conn.execute('COMMIT')
+                    return result
+                if row:
+                    self._delete(conn, key, row[0])
+                self._bump(conn, 'misses')
+                conn.execute('COMMIT')
+                return None
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def get(self, key, dest_path):
+        """Copy a cached document to dest_path; returns False on a miss"""
+        return self._lookup(key, lambda entry_path: shutil.copyfile(entry_path, dest_path)) is not None
+
+    def read(self, key):
+        """Contents of a cached entry as bytes, or None on a miss"""
+        def read_entry(entry_path):
+            with open(entry_path, 'rb') as entry_file:
+                return entry_file.read()
+        return self._lookup(key, read_entry)
+
+    def contains(self, key):
+        """Whether an entry is cached, without counting a hit or touching its access time"""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone()
+        return row is not None and os.path.exists(self._entry_path(key))
+
+    def put(self, key, src_path):
+        """Store a generated document and evict least recently used entries"""
+        return self._store(key, os.path.getsize(src_path), lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def write(self, key, data):
+        """Store bytes as an entry and evict least recently used entries"""
+        def write_entry(tmp_path):
+            with open(tmp_path, 'wb') as entry_file:
+                entry_file.write(data)
+        return self._store(key, len(data), write_entry)
+
+    def _store(self, key, size, fill):
+        if size > self.max_bytes:
+            return False
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        os.close(fd)
+        try:
+            fill(tmp_path)
+            with closing(self._connect()) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    os.replace(tmp_path, self._entry_path(key))
+                    row = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                    if row:
+                        self._bump(conn, 'bytes', -row[0])
+                    conn.execute('INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)',
+                                 (key, size, time.time()))
+                    self._bump(conn, 'bytes', size)
+                    self._evict(conn)
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        while total > self.max_bytes:
+            # Oldest entries in small batches rather than sorting the whole index
+            oldest = conn.execute('SELECT key, size FROM entries ORDER BY last_access LIMIT 32').fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if total <= self.max_bytes:
+                    break
+                self._delete(conn, key, size)
+                try:
+                    os.remove(self._entry_path(key))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self._bump(conn, 'evictions')
+
+    def stats(self):
+        """Hit/miss counters and current size, aggregated over all processes"""
+        with closing(self._connect()) as conn:
+            counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+            'entries': entries,
+            'bytes': size
+        }
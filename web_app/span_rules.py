@@ -0,0 +1,111 @@
+# Declarative rules classifying PDF text spans, compiled into lookup tables
+import re
+import copy
+import json
+
+DEFAULT_SPAN_RULES = {
+    # Standard ABS red (218, 31, 51) plus similar reds; excluded texts are bullets and dashes
+    'red': {
+        'colors': [[218, 31, 51]],
+        'min_red': 150,
+        'max_green_blue': 100,
+        'excluded_text': ["•", "●", "∙", "–"]
+    },
+    # Substrings of a font name that make it bold
+    'bold_font_markers': ["Bold", "Black"],
+    # Red spans that mark a table; 'text' limits a rule to those exact span texts
+    'table': [
+        {'size': 9, 'font': "TimesNewRomanPSMT"},
+        {'size': 12, 'font': "Arial-ItalicMT", 'text': ["2024", "2025"]}
+    ],
+    # Black bold spans rendered as section headings
+    'heading': [
+        {'size': 14, 'font': "Arial-Black"},
+        {'size': 36, 'font': "Arial-Black"}
+    ],
+    # Bold leading span of a numbered section heading, e.g. "1.2.1" in "1.2.1 Goals"
+    'section_number': r'^\d+(\.\d+)*$'
+}
+
+
+def load_span_rules(path=None):
+    """Default rule table with top-level entries replaced by those of a JSON file"""
+    rules = copy.deepcopy(DEFAULT_SPAN_RULES)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            rules.update(json.load(f))
+    return rules
+
+
+class SpanClassifier:
+    """Span predicates compiled from a rule table
+
+    Font rules become dict lookups keyed on (size, font), and every distinct
+    color and font name is evaluated once and memoized. A document uses only a
+    handful of each, so classifying a span costs a few lookups instead of a
+    color conversion, substring checks and a scan of every rule.
+    """
+
+    def __init__(self, rules):
+        red = rules['red']
+        self.red_colors = {tuple(color) for color in red['colors']}
+        self.min_red = red['min_red']
+        self.max_green_blue = red['max_green_blue']
+        self.excluded_text = frozenset(red['excluded_text'])
+        self.bold_font_markers = tuple(rules['bold_font_markers'])
+        # (size, font) -> None for any text, else the set of matching texts
+        self.table_fonts = {}
+        for rule in rules['table']:
+            key = (float(rule['size']), rule['font'])
+            texts = rule.get('text')
+            if texts is None or (key in self.table_fonts and self.table_fonts[key] is None):
+                self.table_fonts[key] = None
+            else:
+                self.table_fonts[key] = self.table_fonts.get(key, set()) | set(texts)
+        self.heading_fonts = {(float(rule['size']), rule['font']) for rule in rules['heading']}
+        self.section_number = re.compile(rules['section_number'])
+        self._color_classes = {}
+        self._bold_fonts = {}
+
+    def color_class(self, color):
+        """'red', 'black' or None for a span's sRGB color integer"""
+        try:
+            return self._color_classes[color]
+        except KeyError:
+            rgb = ((color >> 16) & 255, (color >> 8) & 255, color & 255)
+            if rgb in self.red_colors or (rgb[0] > self.min_red and rgb[1] < self.max_green_blue and
+                                          rgb[2] < self.max_green_blue):
+                color_class = 'red'
+            elif rgb == (0, 0, 0):
+                color_class = 'black'
+            else:
+                color_class = None
+            self._color_classes[color] = color_class
+            return color_class
+
+    def is_bold(self, font_name):
+        try:
+            return self._bold_fonts[font_name]
+        except KeyError:
+            bold = any(marker in font_name for marker in self.bold_font_markers)
+            self._bold_fonts[font_name] = bold
+            return bold
+
+    def is_excluded(self, text):
+        """Whether red text is ignored, such as a lone bullet"""
+        return text in self.excluded_text
+
+    def is_table(self, font_size, font_name, text):
+        """Whether a red span uses one of the table marker fonts"""
+        key = (font_size, font_name)
+        if key not in self.table_fonts:
+            return False
+        texts = self.table_fonts[key]
+        return texts is None or text in texts
+
+    def is_heading(self, font_size, font_name):
+        """Whether a black bold span uses one of the heading fonts"""
+        return (font_size, font_name) in self.heading_fonts
+
+    def is_section_number(self, text):
+        return self.section_number.match(text) is not None
@@ -0,0 +1,44 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app reads its storage paths and cache settings when it is imported
+_storage = tempfile.mkdtemp(prefix='web_app_tests_')
+os.environ.update({
+    'UPLOAD_FOLDER': os.path.join(_storage, 'uploads'),
+    'OUTPUT_FOLDER': os.path.join(_storage, 'output'),
+    'JOB_DB_PATH': os.path.join(_storage, 'jobs.sqlite3'),
+    'METRICS_DB_PATH': os.path.join(_storage, 'metrics.sqlite3'),
+    'RESULT_CACHE_ENABLED': 'false',
+    'RASTER_CACHE_ENABLED': 'false',
+})
+
+RED = (218 / 255, 31 / 255, 51 / 255)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_storage, ignore_errors=True)
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """Write a PDF with one page per list of (text, color) lines and return its path"""
+    def make(pages, name='test.pdf', toc=None):
+        doc = fitz.open()
+        for lines in pages:
+            page = doc.new_page()
+            for line, (text, color) in enumerate(lines):
+                page.insert_text((72, 72 + 24 * line), text, fontsize=11, color=color)
+        if toc:
+            doc.set_toc(toc)
+        path = str(tmp_path / name)
+        doc.save(path)
+        doc.close()
+        return path
+    return make
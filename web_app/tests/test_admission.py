@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import RED
+
+import app
+from instrumentation import PipelineMetrics
+from jobs import JobQueue, JobStore
+
+LINE = ("Shafting is to be designed for the rated power.", RED)
+
+
+@pytest.fixture
+def idle_store(tmp_path, monkeypatch):
+    # A store and queue of their own, so admitted jobs stay queued rather than run
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), app.app.config['PROCESSING_TIMEOUT'],
+                     app.app.config['QUEUE_TIMEOUT'])
+    queue = JobQueue(store, app.process_upload_job, 1, None)
+    monkeypatch.setattr(queue, 'start', lambda: None)
+    monkeypatch.setattr(app, 'job_store', store)
+    monkeypatch.setattr(app, 'job_queue', queue)
+    monkeypatch.setitem(app.app.config, 'ADMISSION_BUDGET', 10)
+    return store
+
+
+def upload(client, pdf_path, name):
+    with open(pdf_path, 'rb') as pdf:
+        return client.post('/upload', data={'files': (pdf, name)}, content_type='multipart/form-data')
+
+
+def rejected_total():
+    # A fresh instance has nothing pending, so it reads what the workers have flushed
+    return PipelineMetrics(app.app.config['METRICS_DB_PATH']).counters()['app_uploads_rejected_total']
+
+
+def test_upload_over_budget_is_refused(idle_store, make_pdf):
+    idle_store.create('in-flight', [], cost=8)
+    rejected = rejected_total()
+    client = app.app.test_client()
+    response = upload(client, make_pdf([[LINE]] * 3, name='three.pdf'), 'three.pdf')
+    assert response.status_code == 429
+    retry_after = int(response.headers['Retry-After'])
+    assert retry_after >= 1
+    assert response.get_json()['retry_after'] == retry_after
+    assert rejected_total() == rejected + 1
+    assert idle_store.in_flight_cost() == 8
+
+
+def test_upload_within_budget_is_queued(idle_store, make_pdf):
+    idle_store.create('in-flight', [], cost=8)
+    client = app.app.test_client()
+    response = upload(client, make_pdf([[LINE]], name='one.pdf'), 'one.pdf')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert idle_store.get(job_id)['status'] == 'queued'
+    assert idle_store.in_flight_cost() > 8
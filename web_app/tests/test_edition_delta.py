@@ -0,0 +1,49 @@
+import os
+import time
+
+from conftest import RED
+
+import app
+
+EDITION = [[("Shafting is to be designed for the rated power.", RED), ("Unchanged black text.", (0, 0, 0))],
+           [("Steering gear is to be tested at sea.", RED)]]
+
+
+def test_identical_editions_have_no_pdf(make_pdf):
+    edition = make_pdf(EDITION, 'edition.pdf')
+    reference = make_pdf(EDITION, 'reference.pdf')
+    images, report, pdf_data = app.extract_red_delta(edition, reference, include_pdf=True)
+    assert images == []
+    assert report['summary']['changed'] == report['summary']['added'] == 0
+    assert pdf_data is None
+
+
+def test_identical_editions_write_no_pdf_file(make_pdf, tmp_path):
+    edition = make_pdf(EDITION, 'edition.pdf')
+    reference = make_pdf(EDITION, 'reference.pdf')
+    pdf_path = str(tmp_path / 'red_content.pdf')
+    _, _, pdf_output = app.extract_red_delta(edition, reference, include_pdf=True, pdf_path=pdf_path)
+    assert pdf_output is None
+    assert not os.path.exists(pdf_path)
+
+
+def test_empty_delta_job_completes_without_pdf(make_pdf):
+    edition = make_pdf(EDITION, 'edition.pdf')
+    client = app.app.test_client()
+    with open(edition, 'rb') as pdf, open(edition, 'rb') as reference:
+        response = client.post('/upload', data={'files': (pdf, 'edition.pdf'),
+                                                'reference': (reference, 'reference.pdf'), 'include_pdf': 'true'},
+                               content_type='multipart/form-data')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + 60
+    while True:
+        status = client.get(f'/status/{job_id}').get_json()
+        if status['status'] in ('completed', 'failed') or time.monotonic() > deadline:
+            break
+        time.sleep(0.2)
+    assert status['status'] == 'completed', status
+    file_info = status['files'][0]
+    assert 'pdf_file' not in file_info
+    assert file_info['changes']['changed'] == 0
+    assert os.path.exists(os.path.join(app.app.config['OUTPUT_FOLDER'], file_info['word_file']))
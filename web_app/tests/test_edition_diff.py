@@ -0,0 +1,70 @@
+import copy
+
+import fitz
+
+from edition_diff import diff_regions, fingerprint_regions
+
+FONT = ('ArialMT', 10.0)
+
+
+def page(page_num, regions, headings=()):
+    """Located page result: regions are (y0, kind, text), text None for a region without red spans"""
+    return {
+        'page_num': page_num,
+        'placements': [(fitz.Rect(50, y0, 500, y0 + 20), kind, None) for y0, kind, _ in regions],
+        'region_spans': [[] if text is None else [(text, *FONT)] for _, _, text in regions],
+        'headings': [((50, y0, 500, y0 + 14), title) for y0, title in headings],
+    }
+
+
+EDITION = [
+    page(0, [(100, 'heading', None), (130, 'text', 'Shafting is to be designed for the rated power.'),
+             (170, 'table', 'Table 1')], headings=[(100, '1.1 Shafting')]),
+    page(1, [(100, 'heading', None), (130, 'text', 'Steering gear is to be tested at sea.')],
+         headings=[(100, '1.2 Steering')]),
+]
+
+
+def diff(edition, reference):
+    regions = fingerprint_regions(edition)
+    return regions, diff_regions(regions, fingerprint_regions(reference))
+
+
+def test_identical_editions_have_no_changes():
+    regions, report = diff(EDITION, copy.deepcopy(EDITION))
+    assert report['changes'] == []
+    assert report['summary'] == {'regions': 3, 'reference_regions': 3, 'unchanged': 3, 'changed': 0, 'added': 0,
+                                 'removed': 0, 'pages_with_changes': 0}
+    assert not any(region['in_delta'] for region in regions)
+
+
+def test_moved_region_is_unchanged():
+    moved = copy.deepcopy(EDITION)
+    moved[0]['placements'][1] = (fitz.Rect(60, 140, 510, 160), 'text', None)
+    _, report = diff(moved, EDITION)
+    assert report['summary']['unchanged'] == 3
+
+
+def test_changed_region_brings_its_section_heading():
+    edition = copy.deepcopy(EDITION)
+    edition[1]['region_spans'][1] = [('Steering gear is to be tested at sea and in port.', *FONT)]
+    regions, report = diff(edition, EDITION)
+    assert report['summary']['changed'] == 1
+    assert report['summary']['pages_with_changes'] == 1
+    delta = [(region['page'], region['kind']) for region in regions if region['in_delta']]
+    assert delta == [(1, 'heading'), (1, 'text')]
+    assert report['changes'][0]['reference']['text'] == 'Steering gear is to be tested at sea.'
+
+
+def test_added_and_removed_regions():
+    edition = copy.deepcopy(EDITION)
+    reference = copy.deepcopy(EDITION)
+    edition[0]['placements'].append((fitz.Rect(50, 300, 500, 320), 'text', None))
+    edition[0]['region_spans'].append([('New requirement.', *FONT)])
+    del reference[1]['placements'][1], reference[1]['region_spans'][1]
+    reference[0]['placements'].append((fitz.Rect(50, 400, 500, 420), 'table', None))
+    reference[0]['region_spans'].append([('Table 2', *FONT)])
+    _, report = diff(edition, reference)
+    statuses = sorted((change['status'], change['text']) for change in report['changes'])
+    assert statuses == [('added', 'New requirement.'), ('added', 'Steering gear is to be tested at sea.'),
+                        ('removed', 'Table 2')]
@@ -0,0 +1,37 @@
+import threading
+import uuid
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def queued_job():
+    # Without a payload no job thread claims it, so it stays queued
+    job_id = str(uuid.uuid4())
+    app.job_store.create(job_id, [{'original_name': 'test.pdf', 'status': 'queued'}])
+    return job_id
+
+
+@pytest.fixture
+def one_stream_slot(monkeypatch):
+    monkeypatch.setattr(app, 'event_stream_slots', threading.BoundedSemaphore(1))
+
+
+def test_streams_over_the_cap_are_refused(queued_job, one_stream_slot):
+    client = app.app.test_client()
+    stream = client.get(f'/events/{queued_job}', buffered=False)
+    assert stream.status_code == 200
+    refused = client.get(f'/events/{queued_job}')
+    assert refused.status_code == 503
+    assert refused.get_json()['status_url'] == f'/status/{queued_job}'
+    stream.close()
+    reopened = client.get(f'/events/{queued_job}', buffered=False)
+    assert reopened.status_code == 200
+    reopened.close()
+
+
+def test_stream_of_expired_job_fails():
+    events = list(app.iter_job_events(str(uuid.uuid4()), None))
+    assert events[-1].startswith('event: job_failed')
@@ -0,0 +1,35 @@
+import fitz
+
+from app import merge_regions
+
+
+def rects(regions):
+    return [(tuple(rect), kind) for rect, kind in regions]
+
+
+def test_overlapping_regions_merge_into_their_union():
+    regions = [(fitz.Rect(10, 10, 100, 40), 'text'), (fitz.Rect(50, 30, 150, 60), 'text')]
+    assert rects(merge_regions(regions, 2)) == [((10, 10, 150, 60), 'text')]
+
+
+def test_regions_within_the_gap_merge():
+    regions = [(fitz.Rect(10, 10, 100, 40), 'text'), (fitz.Rect(10, 41.5, 100, 70), 'text')]
+    assert rects(merge_regions(regions, 2)) == [((10, 10, 100, 70), 'text')]
+
+
+def test_regions_further_apart_than_the_gap_stay_separate():
+    regions = [(fitz.Rect(10, 45, 100, 70), 'text'), (fitz.Rect(10, 10, 100, 40), 'heading')]
+    assert rects(merge_regions(regions, 2)) == [((10, 10, 100, 40), 'heading'), ((10, 45, 100, 70), 'text')]
+
+
+def test_regions_covered_by_a_table_collapse_into_it():
+    regions = [(fitz.Rect(10, 10, 200, 200), 'table'), (fitz.Rect(20, 20, 80, 40), 'text'),
+               (fitz.Rect(20, 50, 80, 60), 'heading')]
+    assert rects(merge_regions(regions, 2)) == [((10, 10, 200, 200), 'table')]
+
+
+def test_union_reaching_a_retired_region_merges_with_it():
+    # The right box is retired by the sweep before the bottom box widens the left column up to it
+    regions = [(fitz.Rect(10, 10, 50, 60), 'text'), (fitz.Rect(150, 10, 190, 20), 'text'),
+               (fitz.Rect(40, 58, 149, 70), 'text')]
+    assert rects(merge_regions(regions, 2)) == [((10, 10, 190, 70), 'text')]
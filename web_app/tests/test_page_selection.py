@@ -0,0 +1,74 @@
+import fitz
+import pytest
+
+from page_selection import parse_page_ranges, section_pages, select_pages
+
+TOC = [
+    [1, 'Chapter 1 General', 1],
+    [2, 'Section 1 Scope', 1],
+    [2, 'Section 2 Definitions', 3],
+    [1, 'Chapter 2 Machinery', 5],
+    [2, 'Section 1 Shafting', 5],
+    [2, 'Section 3 Steering', 8],
+    [2, 'Section 31 Appendix', 9],
+    [1, 'Index', 0],
+]
+
+
+def test_page_ranges():
+    assert parse_page_ranges('1-3, 7', 10) == {0, 1, 2, 6}
+    assert parse_page_ranges('8-', 10) == {7, 8, 9}
+    assert parse_page_ranges('-2', 10) == {0, 1}
+    assert parse_page_ranges(' 2 , ,2-2 ', 10) == {1}
+
+
+@pytest.mark.parametrize('spec', ['5-3', '0', '0-2', '-', 'a', '1-2-3', '1..3'])
+def test_invalid_page_ranges(spec):
+    with pytest.raises(ValueError, match='Invalid page range'):
+        parse_page_ranges(spec, 10)
+
+
+@pytest.mark.parametrize('spec', ['11', '9-11', '12-'])
+def test_page_ranges_past_the_end(spec):
+    with pytest.raises(ValueError, match='out of range'):
+        parse_page_ranges(spec, 10)
+
+
+def test_section_runs_to_the_next_entry_at_its_level():
+    assert section_pages(TOC, 10, 'Section 2 Definitions') == {2, 3}
+    assert section_pages(TOC, 10, 'Chapter 2') == {4, 5, 6, 7, 8, 9}
+
+
+def test_section_names_match_whole_title_prefixes():
+    assert section_pages(TOC, 10, 'Chapter 2 > Section 3') == {7}
+    assert section_pages(TOC, 10, 'section 31') == {8, 9}
+
+
+def test_section_name_matching_several_entries_takes_them_all():
+    assert section_pages(TOC, 10, 'Section 1') == {0, 1, 4, 5, 6}
+
+
+def test_entry_without_a_destination_has_no_pages():
+    assert section_pages(TOC, 10, 'Index') == set()
+
+
+@pytest.mark.parametrize('name', ['Chapter 3', 'Chapter 1 > Section 3', 'Section 3 Steering Gear', ' > '])
+def test_missing_sections(name):
+    with pytest.raises(ValueError):
+        section_pages(TOC, 10, name)
+
+
+def test_select_pages_is_the_union_of_ranges_and_sections():
+    doc = fitz.open()
+    for _ in range(10):
+        doc.new_page()
+    doc.set_toc([entry for entry in TOC if entry[2] > 0])
+    assert select_pages(doc) is None
+    assert select_pages(doc, '1', ['Section 2']) == [0, 2, 3]
+
+
+def test_select_pages_needs_an_outline_for_sections():
+    doc = fitz.open()
+    doc.new_page()
+    with pytest.raises(ValueError, match='no outline'):
+        select_pages(doc, sections=['Chapter 1'])
@@ -0,0 +1,63 @@
+import json
+
+from span_rules import DEFAULT_SPAN_RULES, SpanClassifier, load_span_rules
+
+
+def rgb(red, green, blue):
+    return (red << 16) | (green << 8) | blue
+
+
+def test_color_classes():
+    classifier = SpanClassifier(DEFAULT_SPAN_RULES)
+    assert classifier.color_class(rgb(218, 31, 51)) == 'red'
+    assert classifier.color_class(rgb(200, 60, 60)) == 'red'
+    assert classifier.color_class(rgb(150, 0, 0)) is None
+    assert classifier.color_class(rgb(0, 0, 0)) == 'black'
+    assert classifier.color_class(rgb(40, 40, 40)) is None
+
+
+def test_exact_rule_colors_are_red_outside_the_thresholds():
+    rules = dict(DEFAULT_SPAN_RULES, red=dict(DEFAULT_SPAN_RULES['red'], colors=[[120, 0, 0]]))
+    assert SpanClassifier(rules).color_class(rgb(120, 0, 0)) == 'red'
+
+
+def test_bold_fonts_and_excluded_text():
+    classifier = SpanClassifier(DEFAULT_SPAN_RULES)
+    assert classifier.is_bold('Arial-BoldMT')
+    assert classifier.is_bold('Arial-Black')
+    assert not classifier.is_bold('ArialMT')
+    assert classifier.is_excluded('•')
+    assert not classifier.is_excluded('• Shafting')
+
+
+def test_table_rules_match_on_size_font_and_text():
+    classifier = SpanClassifier(DEFAULT_SPAN_RULES)
+    assert classifier.is_table(9.0, 'TimesNewRomanPSMT', 'any text')
+    assert not classifier.is_table(10.0, 'TimesNewRomanPSMT', 'any text')
+    assert classifier.is_table(12.0, 'Arial-ItalicMT', '2024')
+    assert not classifier.is_table(12.0, 'Arial-ItalicMT', '2023')
+
+
+def test_table_rule_without_text_matches_any_text_of_its_font():
+    rules = dict(DEFAULT_SPAN_RULES, table=[{'size': 9, 'font': 'Font', 'text': ['a']}, {'size': 9, 'font': 'Font'}])
+    assert SpanClassifier(rules).is_table(9.0, 'Font', 'b')
+
+
+def test_headings_and_section_numbers():
+    classifier = SpanClassifier(DEFAULT_SPAN_RULES)
+    assert classifier.is_heading(14.0, 'Arial-Black')
+    assert not classifier.is_heading(14.0, 'ArialMT')
+    assert classifier.is_section_number('1.2.1')
+    assert not classifier.is_section_number('1.2.')
+    assert not classifier.is_section_number('Section 1')
+
+
+def test_load_span_rules_replaces_top_level_entries(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'heading': [{'size': 16, 'font': 'Custom-Bold'}]}))
+    rules = load_span_rules(str(path))
+    assert rules['heading'] == [{'size': 16, 'font': 'Custom-Bold'}]
+    assert rules['table'] == DEFAULT_SPAN_RULES['table']
+    classifier = SpanClassifier(rules)
+    assert classifier.is_heading(16.0, 'Custom-Bold')
+    assert not classifier.is_heading(14.0, 'Arial-Black')
@@ -0,0 +1,31 @@
+import hashlib
+
+import pytest
+
+from conftest import RED
+
+import app
+from result_cache import ResultCache
+
+
+def test_fully_cached_upload_completes_without_queueing(make_pdf, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'result_cache', ResultCache(str(tmp_path / 'cache'), 10 * 1024 * 1024))
+    pdf_path = make_pdf([[("Shafting is to be designed for the rated power.", RED)]])
+    with open(pdf_path, 'rb') as pdf:
+        pdf_hash = hashlib.sha256(pdf.read()).hexdigest()
+    cached_docx = tmp_path / 'cached.docx'
+    cached_docx.write_bytes(b'cached document')
+    app.result_cache.put(app.result_cache_key(pdf_hash), str(cached_docx))
+    monkeypatch.setattr(app.job_queue, 'submit', lambda *args, **kwargs: pytest.fail('upload was queued'))
+
+    client = app.app.test_client()
+    with open(pdf_path, 'rb') as pdf:
+        response = client.post('/upload', data={'files': (pdf, 'cached.pdf')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    job_id = response.get_json()['job_id']
+    status = client.get(f'/status/{job_id}').get_json()
+    assert status['status'] == 'completed'
+    assert status['files'][0]['cached'] is True
+    download = client.get(f"/download/{status['files'][0]['word_file']}")
+    assert download.data == b'cached document'
+    download.close()
@@ -0,0 +1,32 @@
+import fitz
+from docx import Document
+
+from conftest import RED
+
+import app
+
+# A text record whose run has no color, so writing it fails after its paragraph was added
+BROKEN_BLOCKS = [((72, 60, 320, 80), 0, [(76, [("Shafting is to be designed", 11, False, False, None)])])]
+
+
+def build(tmp_path, pdf_source):
+    builder = app.WordDocumentBuilder(pdf_source)
+    builder.add(app._image_record(0, fitz.Rect(60, 50, 400, 90), 'text', None, BROKEN_BLOCKS))
+    docx_path = str(tmp_path / 'out.docx')
+    builder.save(docx_path)
+    return builder, Document(docx_path)
+
+
+def test_failed_text_record_falls_back_to_an_image(make_pdf, tmp_path):
+    pdf_path = make_pdf([[("Shafting is to be designed for the rated power.", RED)]])
+    builder, doc = build(tmp_path, pdf_path)
+    assert builder.image_bytes > 0
+    assert len(doc.inline_shapes) == 1
+    assert [paragraph.text for paragraph in doc.paragraphs] == ['']
+
+
+def test_failed_text_record_without_a_source_leaves_nothing_behind(tmp_path):
+    builder, doc = build(tmp_path, None)
+    assert builder.image_bytes == 0
+    assert len(doc.inline_shapes) == 0
+    assert all('Shafting' not in paragraph.text for paragraph in doc.paragraphs)